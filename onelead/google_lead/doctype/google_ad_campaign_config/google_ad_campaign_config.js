@@ -2,6 +2,17 @@
 // For license information, please see license.txt
 
 frappe.ui.form.on("Google Ad Campaign Config", {
+  onload: function(frm) {
+    // Offer the registered formatting functions in the mapping rows
+    frappe.call({
+      method: "onelead.utils.formatting_functions.get_function_names",
+      callback: function(response) {
+        frm.fields_dict.mapping.grid.update_docfield_property(
+          "formatting_function", "options", ["", ...(response.message || [])]
+        );
+      }
+    });
+  },
   lead_doctype: function(frm) {
     if (frm.doc.lead_doctype) {
       frappe.call({
@@ -4,6 +4,9 @@
 import frappe
 from frappe.model.document import Document
 
+from onelead.utils.formatting_functions import FORMATTING_FUNCTIONS
+from onelead.utils.google_config import clear_campaign_config_cache
+
 
 class GoogleAdCampaignConfig(Document):
 
@@ -27,6 +30,9 @@ class GoogleAdCampaignConfig(Document):
 			if not mapping.ad_form_field_key:
 				frappe.throw(f"The Ad Form Field Key cannot be empty for '{lead_field}' in mapping.")
 
+			if mapping.formatting_function and mapping.formatting_function not in FORMATTING_FUNCTIONS:
+				frappe.throw(f"Formatting function '{mapping.formatting_function}' for '{lead_field}' is not registered.")
+
 		for constant in self.constants:
 			lead_field = constant.lead_doctype_field
 			
@@ -66,3 +72,10 @@ class GoogleAdCampaignConfig(Document):
 
 			# Update the field type in the child table (for informational purposes)
 			constant.field_type = field_type
+
+	def on_update(self):
+		# The campaign id may have changed too, so all cached configs are dropped
+		clear_campaign_config_cache()
+
+	def on_trash(self):
+		clear_campaign_config_cache()
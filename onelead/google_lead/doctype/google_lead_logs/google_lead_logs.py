@@ -4,6 +4,10 @@
 # import frappe
 from frappe.model.document import Document
 
+from onelead.utils.payload_codec import decode_payload_text
+
 
 class GoogleLeadLogs(Document):
-	pass
+	def onload(self):
+		# The payload may be stored compressed, show it as plain JSON in the form
+		self.json = decode_payload_text(self.json)
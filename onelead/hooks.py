@@ -26,7 +26,28 @@ doc_events = {
         "before_save": "onelead.utils.meta.manage_ads.fetch_form_details"
     },
     "Meta Webhook Lead Logs": {
-        "after_insert": "onelead.utils.meta.manage_leads.process_logged_lead"
+        "after_insert": "onelead.utils.meta.manage_leads.handle_logged_lead"
+    },
+    "Meta Ads Page Config": {
+        "on_update": "onelead.utils.meta_lead.clear_lead_routing_index",
+        "on_trash": "onelead.utils.meta_lead.clear_lead_routing_index",
+        "after_rename": "onelead.utils.meta_lead.clear_lead_routing_index"
+    },
+    "Meta Ads Webhook Config": {
+        "on_update": "onelead.utils.meta_lead.clear_lead_routing_index",
+        "on_trash": "onelead.utils.meta_lead.clear_lead_routing_index",
+        "after_rename": "onelead.utils.meta_lead.clear_lead_routing_index"
+    },
+    "Meta Webhook Config": {
+        "on_update": [
+            "onelead.utils.meta.credentials.clear_credentials_cache",
+            "onelead.utils.meta.token_manager.clear_token_state"
+        ]
+    },
+    "Meta Page": {
+        "on_update": "onelead.utils.meta.credentials.clear_credentials_cache",
+        "on_trash": "onelead.utils.meta.credentials.clear_credentials_cache",
+        "after_rename": "onelead.utils.meta.credentials.clear_credentials_cache"
     }
 }
 
@@ -159,6 +180,18 @@ after_install = "onelead.install.after_install"
 # Scheduled Tasks
 # ---------------
 
+scheduler_events = {
+	"hourly": [
+		"onelead.utils.meta.backfill.resume_stalled_backfills",
+		"onelead.utils.meta.polling.poll_leads",
+		"onelead.utils.meta.token_manager.schedule_token_refresh",
+		"onelead.utils.meta.sync.fail_stale_sync_runs"
+	],
+	"daily": [
+		"onelead.utils.lead_archive.archive_lead_logs"
+	],
+}
+
 # scheduler_events = {
 # 	"all": [
 # 		"onelead.tasks.all"
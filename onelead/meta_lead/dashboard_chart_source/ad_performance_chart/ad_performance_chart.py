@@ -1,28 +1,34 @@
 import frappe
 from collections import defaultdict
 
+from onelead.utils.meta.chart_cache import get_cached_chart
+
 @frappe.whitelist()
 def get(chart_name=None, chart=None, no_cache=None, filters=None, from_date=None, to_date=None, timespan=None, time_interval=None, heatmap_year=None):
+    return get_cached_chart("ad_performance_chart", get_chart_data, no_cache=no_cache, filters=filters)
+
+def get_chart_data(filters=None):
     filters = frappe.parse_json(filters) if filters else {}
     status_filter = filters.get("processing_status") or "Processed"
     limit = filters.get("no_of_ads") or 15
     # limit = 15  # Top 15 ads
 
-    # Join Meta Webhook Lead Logs with Ads to get ad_name
+    # Join the lead rollup with Ads to get ad_name
     data = frappe.db.sql("""
         SELECT 
             a.ads_name AS ad_label,
-            COUNT(*) as total
-        FROM `tabMeta Webhook Lead Logs` l
-        JOIN `tabMeta Ads` a ON a.name = l.ads
-        WHERE l.processing_status = %s
+            SUM(r.lead_count) as total
+        FROM `tabMeta Lead Rollup` r
+        JOIN `tabMeta Ads` a ON a.name = r.ads
+        WHERE r.processing_status = %s
         GROUP BY a.ads_name
+        HAVING total > 0
         ORDER BY total DESC
         LIMIT %s
     """, (status_filter, limit), as_dict=True)
 
     labels = [row["ad_label"] for row in data]
-    values = [row["total"] for row in data]
+    values = [int(row["total"]) for row in data]
 
     return {
         "labels": labels,
@@ -4,10 +4,17 @@ from collections import defaultdict
 import datetime
 import calendar
 
+from onelead.utils.meta.chart_cache import get_cached_chart
+
 @frappe.whitelist()
 def get(chart_name=None, chart=None, no_cache=None, filters=None,
         from_date=None, to_date=None, timespan=None, time_interval=None, heatmap_year=None):
-    
+    return get_cached_chart(
+        "platform_wise_leads", get_chart_data, no_cache=no_cache, filters=filters,
+        from_date=from_date, to_date=to_date, timespan=timespan, time_interval=time_interval
+    )
+
+def get_chart_data(filters=None, from_date=None, to_date=None, timespan=None, time_interval=None):
     filters = frappe.parse_json(filters) if filters else {}
     status_filter = filters.get("processing_status") or "Processed"
 
@@ -29,28 +36,27 @@ def get(chart_name=None, chart=None, no_cache=None, filters=None,
 
     # Grouping format based on time interval
     if time_interval == "Daily":
-        sql_period = "DATE(created_time)"
+        sql_period = "day"
     elif time_interval == "Weekly":
-        sql_period = "YEARWEEK(created_time, 3)"
+        sql_period = "YEARWEEK(day, 3)"
     elif time_interval == "Monthly":
-        sql_period = "DATE_FORMAT(creation, '%%Y-%%m')"
+        sql_period = "DATE_FORMAT(day, '%%Y-%%m')"
     elif time_interval == "Quarterly":
-        sql_period = "CONCAT(YEAR(created_time), '-Q', QUARTER(created_time))"
+        sql_period = "CONCAT(YEAR(day), '-Q', QUARTER(day))"
     elif time_interval == "Yearly":
-        sql_period = "YEAR(created_time)"
+        sql_period = "YEAR(day)"
     else:
-        sql_period = "YEARWEEK(created_time, 3)"  # default to weekly
+        sql_period = "YEARWEEK(day, 3)"  # default to weekly
 
-    doc_type = "Meta Webhook Lead Logs"
-    # Fetch weekly lead count grouped by platform
+    # Lead counts per day are kept in the rollup, so this reads days rather than lead logs
     raw_data = frappe.db.sql(f"""
         SELECT 
             {sql_period} AS period,
             platform,
-            COUNT(*) as count
-        FROM `tab{doc_type}`
+            SUM(lead_count) as count
+        FROM `tabMeta Lead Rollup`
         WHERE processing_status = %s
-          AND created_time BETWEEN %s AND %s
+          AND day BETWEEN %s AND %s
         GROUP BY period, platform
         ORDER BY period ASC
     """, (status_filter, from_date, to_date), as_dict=True)
@@ -58,14 +64,10 @@ def get(chart_name=None, chart=None, no_cache=None, filters=None,
     period_map = defaultdict(lambda: {"Instagram": 0, "Facebook": 0, "Other": 0})
     label_map = {}
 
-    print(filters)
-    print(from_date, to_date)
-    print(raw_data)
-
     for row in raw_data:
         period = row["period"]
         platform = row["platform"] or "Other"
-        count = row["count"]
+        count = int(row["count"])
         label = str(period)
 
         # if time_interval == "Weekly":
@@ -133,5 +133,25 @@ frappe.ui.form.on("Meta Lead Form", {
       })
       .attr('title', __('Create a new Meta Ads document using fields from this form, If not, this will be created automatically when leads are received.'));
     }
+
+    if (!frm.is_new() && !["Queued", "Running"].includes(frm.doc.backfill_status)) {
+      frm.add_custom_button(__('Backfill Leads'), function () {
+        frappe.call({
+          method: "onelead.utils.meta.backfill.start_lead_backfill",
+          args: {
+            form_name: frm.doc.name,
+            // Start over once a backfill is done, else resume from the stored cursor
+            restart: frm.doc.backfill_status === "Completed" ? 1 : 0
+          },
+          callback: function (r) {
+            if (!r.exc) {
+              frappe.show_alert({ message: __('Lead backfill queued'), indicator: 'green' });
+              frm.reload_doc();
+            }
+          }
+        });
+      })
+      .attr('title', __('Fetch past leads of this form from Meta, leads already logged are skipped.'));
+    }
   }
 });
@@ -0,0 +1,8 @@
+// Copyright (c) 2026, Redsoftware Solutions and contributors
+// For license information, please see license.txt
+
+// frappe.ui.form.on("Meta Lead Rollup", {
+// 	refresh(frm) {
+
+// 	},
+// });
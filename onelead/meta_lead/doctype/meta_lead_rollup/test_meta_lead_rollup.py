@@ -0,0 +1,9 @@
+# Copyright (c) 2026, Redsoftware Solutions and Contributors
+# See license.txt
+
+# import frappe
+from frappe.tests.utils import FrappeTestCase
+
+
+class TestMetaLeadRollup(FrappeTestCase):
+	pass
\ No newline at end of file
@@ -1,8 +1,21 @@
 // Copyright (c) 2024, Redsoftware Solutions and contributors
 // For license information, please see license.txt
 
-// frappe.ui.form.on("Meta Page", {
-// 	refresh(frm) {
-
-// 	},
-// });
+frappe.ui.form.on("Meta Page", {
+  refresh(frm) {
+    if (!frm.is_new()) {
+      frm.add_custom_button(__('Backfill Leads'), function () {
+        frappe.call({
+          method: "onelead.utils.meta.backfill.start_lead_backfill",
+          args: { page: frm.doc.name },
+          callback: function (r) {
+            if (!r.exc) {
+              frappe.show_alert({ message: __('Lead backfill queued for {0} forms', [r.message.forms]), indicator: 'green' });
+            }
+          }
+        });
+      })
+      .attr('title', __('Fetch past leads of all forms of this page from Meta, leads already logged are skipped.'));
+    }
+  },
+});
@@ -4,6 +4,19 @@
 # import frappe
 from frappe.model.document import Document
 
+from onelead.utils.meta.lead_stats import track_lead_log, untrack_lead_log
+from onelead.utils.payload_codec import decode_payload_text
+
 
 class MetaWebhookLeadLogs(Document):
-	pass
+	def onload(self):
+		# Payloads may be stored compressed, show them as plain JSON in the form
+		self.raw_payload = decode_payload_text(self.raw_payload)
+		self.lead_payload = decode_payload_text(self.lead_payload)
+
+	def on_change(self):
+		# Runs after insert, save and every db_set, keeps the dashboard rollup in step with the log
+		track_lead_log(self)
+
+	def on_trash(self):
+		untrack_lead_log(self)
@@ -0,0 +1,10 @@
+import frappe
+
+from onelead.utils.meta.lead_stats import rebuild_lead_rollup
+
+
+def execute():
+	"""Count the existing lead logs into Meta Lead Rollup, later changes keep it up to date."""
+	frappe.reload_doc("meta_lead", "doctype", "meta_lead_rollup")
+	frappe.reload_doc("meta_lead", "doctype", "meta_webhook_lead_logs")
+	rebuild_lead_rollup()
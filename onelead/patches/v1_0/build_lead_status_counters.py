@@ -0,0 +1,9 @@
+import frappe
+
+from onelead.utils.meta.lead_stats import rebuild_status_counters
+
+
+def execute():
+	"""Count the existing lead logs into Meta Lead Status Counter, later changes keep it up to date."""
+	frappe.reload_doc("meta_lead", "doctype", "meta_lead_status_counter")
+	rebuild_status_counters()
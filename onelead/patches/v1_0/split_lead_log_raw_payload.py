@@ -0,0 +1,68 @@
+import json
+
+import frappe
+
+from onelead.utils.meta_lead import store_webhook_payload
+
+BATCH_SIZE = 500
+
+
+def execute():
+	"""
+	Older lead logs carry the whole webhook body in `raw_payload`, once per lead of the batch.
+	Store each distinct body once in Meta Webhook Payload and keep only the lead's own change
+	in `raw_payload`.
+	"""
+	last_name = ""
+	while True:
+		logs = frappe.db.sql(
+			"""
+			SELECT name, leadgen_id, raw_payload, received_time
+			FROM `tabMeta Webhook Lead Logs`
+			WHERE name > %s AND IFNULL(webhook_payload, '') = '' AND raw_payload IS NOT NULL
+			ORDER BY name
+			LIMIT %s
+			""",
+			(last_name, BATCH_SIZE),
+			as_dict=True,
+		)
+		if not logs:
+			break
+
+		for log in logs:
+			split_raw_payload(log)
+
+		last_name = logs[-1].name
+		frappe.db.commit()
+
+
+def split_raw_payload(log):
+	try:
+		data = json.loads(log.raw_payload)
+	except (TypeError, ValueError):
+		return
+
+	if not isinstance(data, dict) or "entry" not in data:
+		return
+
+	changes = [
+		{"entry_id": entry.get("id"), "time": entry.get("time"), **change}
+		for entry in data.get("entry", [])
+		for change in entry.get("changes", [])
+		if change.get("field") == "leadgen"
+	]
+	lead_change = next(
+		(change for change in changes if change.get("value", {}).get("leadgen_id") == log.leadgen_id),
+		None,
+	)
+	if not lead_change:
+		return
+
+	# Hash the stored text as is, so all logs of the same batch point to one payload
+	webhook_payload = store_webhook_payload(log.raw_payload, len(changes), log.received_time)
+	frappe.db.set_value(
+		"Meta Webhook Lead Logs",
+		log.name,
+		{"raw_payload": json.dumps(lead_change), "webhook_payload": webhook_payload},
+		update_modified=False,
+	)
@@ -0,0 +1,117 @@
+from collections import namedtuple
+
+import frappe
+from frappe.utils.data import cast
+
+from .formatting_functions import FORMATTING_FUNCTIONS
+from .meta.mapping_plan import parse_function_parameters
+
+# One mapping row of a Google Ad Campaign Config, `formatter` is the name of a registered formatting function
+GoogleMappingStep = namedtuple("GoogleMappingStep", ["form_key", "lead_field", "formatter", "args", "kwargs"])
+
+# Compiled Google Ad Campaign Config, `steps` is a tuple of GoogleMappingStep
+# and `constants` a tuple of (lead field, value cast to the field's type) pairs
+GoogleCampaignConfig = namedtuple("GoogleCampaignConfig", ["name", "webhook_key", "lead_doctype", "steps", "constants"])
+
+# Redis hash of {campaign_id: GoogleCampaignConfig}, dropped whenever a config is saved or deleted
+CAMPAIGN_CONFIG_CACHE_KEY = "onelead_google_campaign_plans"
+
+# Returned by format_phone_number for numbers it can't parse
+INVALID_PHONE_NUMBER = "Invalid number"
+
+
+def get_campaign_config(campaign_id):
+    """Return the compiled config of a Google Ads campaign, None when the campaign has no config."""
+    if not campaign_id:
+        return None
+
+    config = frappe.cache.hget(CAMPAIGN_CONFIG_CACHE_KEY, campaign_id)
+    if config:
+        return config
+
+    # Unknown campaigns aren't cached, guests could grow the hash with made up campaign ids otherwise
+    config = compile_campaign_config(campaign_id)
+    if config:
+        frappe.cache.hset(CAMPAIGN_CONFIG_CACHE_KEY, campaign_id, config)
+    return config
+
+
+def compile_campaign_config(campaign_id):
+    name = frappe.db.get_value("Google Ad Campaign Config", {"campaign_id": campaign_id})
+    if not name:
+        return None
+
+    config = frappe.get_doc("Google Ad Campaign Config", name)
+    steps = []
+    for mapping in config.mapping:
+        formatter = mapping.formatting_function
+        if formatter and formatter not in FORMATTING_FUNCTIONS:
+            frappe.logger().warning(
+                f"Formatting function '{formatter}' of {mapping.lead_doctype_field} in Google Ad Campaign Config {config.name} is not registered"
+            )
+            formatter = None
+
+        args, kwargs = (), {}
+        params = parse_function_parameters(mapping.function_parameters)
+        if isinstance(params, dict):
+            kwargs = params
+        else:
+            args = tuple(params)
+
+        steps.append(GoogleMappingStep(
+            form_key=mapping.ad_form_field_key,
+            lead_field=mapping.lead_doctype_field,
+            formatter=formatter,
+            args=args,
+            kwargs=kwargs
+        ))
+
+    return GoogleCampaignConfig(
+        name=config.name,
+        webhook_key=config.webhook_key,
+        lead_doctype=config.lead_doctype,
+        steps=tuple(steps),
+        # Constants were checked and converted on validate, stored as text they're only cast back
+        constants=tuple(
+            (constant.lead_doctype_field, cast(constant.field_type, constant.constant_value))
+            for constant in config.constants
+        )
+    )
+
+
+def map_lead_values(config, form_values):
+    """Return the lead values of a Google lead, from its {column_id: value} and a compiled config."""
+    values = {}
+    for step in config.steps:
+        if step.form_key not in form_values:
+            continue
+
+        value = form_values[step.form_key]
+        if step.formatter and value:
+            try:
+                formatted = FORMATTING_FUNCTIONS[step.formatter](value, *step.args, **step.kwargs)
+                # Keep the number as submitted rather than losing the lead's contact
+                if formatted != INVALID_PHONE_NUMBER:
+                    value = formatted
+            except Exception as e:
+                frappe.logger().error(f"Error in formatting function '{step.formatter}' for {step.lead_field}: {str(e)}")
+        elif step.form_key == "PHONE_NUMBER":
+            value = format_google_phone_number(value)
+
+        values[step.lead_field] = value
+
+    # Constants take precedence over mapped values
+    values.update(config.constants)
+    return values
+
+
+def format_google_phone_number(phone_number):
+    """Split the country code of an international number off, other numbers are kept as is."""
+    if phone_number and phone_number.startswith("+"):
+        phone_number = phone_number.replace(" ", "").replace("-", "")
+        return f"{phone_number[:3]}-{phone_number[3:]}"
+    return phone_number
+
+
+def clear_campaign_config_cache():
+    frappe.cache.delete_key(CAMPAIGN_CONFIG_CACHE_KEY)
@@ -0,0 +1,230 @@
+import json
+
+import frappe
+from frappe.utils import add_days, cint, now, now_datetime
+
+from .payload_codec import compress, decode_payload, decode_payload_text, decompress
+
+ARCHIVE_QUEUE = "long"
+
+# Logs moved per transaction, and batches per source in one run, the next run picks up the rest
+ARCHIVE_BATCH_SIZE = 500
+ARCHIVE_MAX_BATCHES = 100
+
+# Meta lead logs in these statuses are done with, others may still be retried
+ARCHIVED_LEAD_STATUSES = ("Processed", "Loss")
+
+ARCHIVE_FIELDS = (
+    "source_doctype", "source_name", "leadgen_id", "log_created", "processing_status", "lead_doctype",
+    "lead_doc_reference", "created_time", "platform", "lead_form", "ads", "campaign", "compressed_payload"
+)
+
+
+def archive_lead_logs():
+    """Daily. Queue the archiving of old lead logs when `archive_after_days` is set."""
+    if not cint(frappe.db.get_single_value("Meta Webhook Config", "archive_after_days")):
+        return
+
+    frappe.enqueue(
+        "onelead.utils.lead_archive.run_lead_log_archive",
+        queue=ARCHIVE_QUEUE,
+        job_id="onelead_lead_log_archive",
+        deduplicate=True
+    )
+
+
+def run_lead_log_archive():
+    """
+    Move lead logs older than `archive_after_days` to Lead Log Archive, in batches of ARCHIVE_BATCH_SIZE.
+    Meta lead logs are deleted without their hooks, so they stay counted in the lead rollup.
+    """
+    days = cint(frappe.db.get_single_value("Meta Webhook Config", "archive_after_days"))
+    if not days:
+        return
+
+    cutoff = add_days(now_datetime(), -days)
+    meta_logs = archive_logs(
+        "Meta Webhook Lead Logs",
+        filters={"processing_status": ["in", ARCHIVED_LEAD_STATUSES], "creation": ["<", cutoff]},
+        fields=[
+            "leadgen_id", "processing_status", "lead_doctype", "lead_doc_reference", "created_time", "platform",
+            "lead_form", "ads", "campaign", "raw_payload", "lead_payload", "webhook_payload"
+        ],
+        build_rows=lambda logs: [build_meta_archive_row(log) for log in logs],
+        after_batch=archive_unused_webhook_payloads
+    )
+    google_logs = archive_logs(
+        "Google Lead Logs",
+        filters={"creation": ["<", cutoff]},
+        fields=["json"],
+        build_rows=lambda logs: [build_google_archive_row(log) for log in logs]
+    )
+    frappe.logger().info(f"Archived {meta_logs} Meta lead logs and {google_logs} Google lead logs")
+
+
+def archive_logs(doctype, filters, fields, build_rows, after_batch=None):
+    """
+    Copy matching logs to the archive and delete them, a batch per transaction. Returns the number archived.
+    `after_batch` is called with the archived logs, in the batch's transaction.
+    """
+    archived = 0
+    for _ in range(ARCHIVE_MAX_BATCHES):
+        logs = frappe.get_all(
+            doctype,
+            filters=filters,
+            fields=["name", "creation", *fields],
+            order_by="creation asc",
+            limit=ARCHIVE_BATCH_SIZE
+        )
+        if not logs:
+            break
+
+        insert_archive_rows(build_rows(logs), doctype)
+        frappe.db.delete(doctype, {"name": ["in", [log.name for log in logs]]})
+        if after_batch:
+            after_batch(logs)
+        frappe.db.commit()
+        archived += len(logs)
+    return archived
+
+
+def build_meta_archive_row(log):
+    return {
+        "source_name": log.name,
+        "leadgen_id": log.leadgen_id,
+        "log_created": log.creation,
+        "processing_status": log.processing_status,
+        "lead_doctype": log.lead_doctype,
+        "lead_doc_reference": log.lead_doc_reference,
+        "created_time": log.created_time,
+        "platform": log.platform,
+        "lead_form": log.lead_form,
+        "ads": log.ads,
+        "campaign": log.campaign,
+        "compressed_payload": compress_payload({
+            "raw_payload": log.raw_payload,
+            "lead_payload": log.lead_payload,
+            "webhook_payload": log.webhook_payload
+        })
+    }
+
+
+def archive_unused_webhook_payloads(logs):
+    """
+    Move the webhook bodies of archived logs that no remaining lead log refers to into the archive,
+    one archive row per body named by its Meta Webhook Payload, which archived logs keep referring to.
+    """
+    payload_names = {log.webhook_payload for log in logs if log.webhook_payload}
+    if not payload_names:
+        return
+
+    in_use = set(frappe.get_all(
+        "Meta Webhook Lead Logs",
+        filters={"webhook_payload": ["in", list(payload_names)]},
+        pluck="webhook_payload",
+        distinct=True
+    ))
+    unused = list(payload_names - in_use)
+    if not unused:
+        return
+
+    payloads = frappe.get_all(
+        "Meta Webhook Payload",
+        filters={"name": ["in", unused]},
+        fields=["name", "creation", "payload", "change_count", "received_time"]
+    )
+    insert_archive_rows([
+        {
+            "source_name": payload.name,
+            "log_created": payload.creation,
+            "compressed_payload": compress_payload({
+                "payload": payload.payload,
+                "change_count": payload.change_count,
+                "received_time": payload.received_time
+            })
+        }
+        for payload in payloads
+    ], "Meta Webhook Payload")
+    frappe.db.delete("Meta Webhook Payload", {"name": ["in", unused]})
+
+
+def build_google_archive_row(log):
+    try:
+        lead_id = json.loads(decode_payload_text(log.json) or "{}").get("lead_id")
+    except ValueError:
+        lead_id = None
+
+    return {
+        "source_name": log.name,
+        "leadgen_id": lead_id,
+        "log_created": log.creation,
+        "compressed_payload": compress_payload({"json": log.json})
+    }
+
+
+def insert_archive_rows(rows, source_doctype):
+    timestamp = now()
+    user = frappe.session.user
+    values = []
+    for row in rows:
+        row["source_doctype"] = source_doctype
+        values.append((
+            frappe.generate_hash(length=10), timestamp, timestamp, user, user, 0, 0,
+            *(row.get(field) for field in ARCHIVE_FIELDS)
+        ))
+
+    frappe.db.bulk_insert(
+        "Lead Log Archive",
+        ["name", "creation", "modified", "owner", "modified_by", "docstatus", "idx", *ARCHIVE_FIELDS],
+        values
+    )
+
+
+def compress_payload(values):
+    return compress(json.dumps(values))
+
+
+def decompress_payload(data):
+    return json.loads(decompress(data))
+
+
+@frappe.whitelist()
+def get_archived_payload(leadgen_id):
+    """
+    Return the archived log of a lead by its leadgen ID (lead ID for Google leads),
+    with its payload columns decoded, None if the lead isn't archived.
+    """
+    frappe.has_permission("Lead Log Archive", "read", throw=True)
+
+    archive = frappe.db.get_value(
+        "Lead Log Archive",
+        {"leadgen_id": leadgen_id},
+        ["name", "source_doctype", "source_name", "log_created", "processing_status", "compressed_payload"],
+        as_dict=True,
+        order_by="creation desc"
+    )
+    if not archive:
+        return None
+
+    payload = decompress_payload(archive.pop("compressed_payload"))
+    # The webhook payload is the name of the Meta Webhook Payload the body was stored in, the rest hold payloads
+    archive.payload = {
+        field: value if field == "webhook_payload" else decode_payload(value)
+        for field, value in payload.items()
+    }
+    if payload.get("webhook_payload"):
+        archive.webhook_body = get_webhook_body(payload["webhook_payload"])
+    return archive
+
+
+def get_webhook_body(payload_name):
+    """Return the parsed webhook body stored as `payload_name`, from Meta Webhook Payload or the archive."""
+    body = frappe.db.get_value("Meta Webhook Payload", payload_name, "payload")
+    if body is None:
+        compressed = frappe.db.get_value(
+            "Lead Log Archive", {"source_doctype": "Meta Webhook Payload", "source_name": payload_name}, "compressed_payload"
+        )
+        if not compressed:
+            return None
+        body = decompress_payload(compressed)["payload"]
+    return decode_payload(body)
@@ -0,0 +1,175 @@
+import time
+
+import frappe
+from frappe.utils import add_to_date, cint, get_datetime, now_datetime
+from frappe.utils.background_jobs import get_queues_timeout
+
+from .credentials import get_page_access_token
+from .graph_client import graph_get
+from .lead_batch import process_lead_logs_in_batches
+from .manage_leads import LEAD_FIELDS
+from ..meta_lead import create_lead_logs_in_bulk
+
+BACKFILL_QUEUE = "long"
+
+# Leads requested per Graph API page
+BACKFILL_PAGE_SIZE = 100
+
+# Seconds kept before the queue timeout to hand over to a new job, a page is well within it
+BACKFILL_TIMEOUT_MARGIN = 120
+
+
+@frappe.whitelist()
+def start_lead_backfill(form_name=None, page=None, restart=0):
+    """
+    Queue a backfill of past leads for a Meta Lead Form, or for all forms of a Meta Page.
+    A backfill resumes from its stored cursor unless `restart` is set.
+    """
+    if form_name:
+        forms = [form_name]
+    elif page:
+        forms = frappe.get_all("Meta Lead Form", filters={"page": page}, pluck="name")
+    else:
+        frappe.throw("Select a Meta Lead Form or a Meta Page to backfill leads for.")
+
+    for form in forms:
+        enqueue_lead_backfill(form, restart=cint(restart))
+
+    return {"status": "queued", "forms": len(forms)}
+
+
+def enqueue_lead_backfill(form_name, restart=False, deduplicate=True):
+    values = {"backfill_status": "Queued", "backfill_updated_at": now_datetime()}
+    if restart:
+        values.update({"backfill_cursor": None, "backfilled_leads": 0})
+    frappe.db.set_value("Meta Lead Form", form_name, values, update_modified=False)
+
+    frappe.enqueue(
+        "onelead.utils.meta.backfill.run_lead_backfill",
+        form_name=form_name,
+        queue=BACKFILL_QUEUE,
+        # The job handing over to its successor is still running, so it can't be deduplicated
+        job_id=f"onelead_backfill_{form_name}" if deduplicate else None,
+        deduplicate=deduplicate,
+        enqueue_after_commit=True
+    )
+
+
+def run_lead_backfill(form_name):
+    """
+    Page through the leads of a Meta Lead Form and log the ones not logged yet.
+
+    The paging cursor is committed along with each page, so a job that stops for any reason
+    continues from the last stored page. Before the queue timeout the job queues its own
+    successor instead of being killed mid page.
+    """
+    form = frappe.db.get_value(
+        "Meta Lead Form", form_name, ["name", "form_id", "page", "backfill_cursor", "backfilled_leads"], as_dict=True
+    )
+    if not form:
+        return
+
+    access_token = get_page_access_token(form.page) if form.page else None
+    if not access_token:
+        set_backfill_state(form_name, "Failed")
+        frappe.logger().error(f"Backfill of Meta Lead Form {form_name} failed: no page access token for page {form.page}")
+        return
+
+    global_conf = frappe.get_cached_doc("Meta Webhook Config")
+    url = f"{global_conf.meta_url}/{global_conf.meta_api_version}/{form.form_id}/leads"
+    params = {"access_token": access_token, "fields": ",".join(["id", *LEAD_FIELDS]), "limit": BACKFILL_PAGE_SIZE}
+    deadline = time.monotonic() + get_queues_timeout()[BACKFILL_QUEUE] - BACKFILL_TIMEOUT_MARGIN
+
+    cursor = form.backfill_cursor
+    backfilled_leads = form.backfilled_leads or 0
+    set_backfill_state(form_name, "Running")
+
+    try:
+        while True:
+            if time.monotonic() > deadline:
+                enqueue_lead_backfill(form_name, deduplicate=False)
+                frappe.db.commit()
+                return
+
+            if cursor:
+                params["after"] = cursor
+            response = graph_get(url, params=params)
+            if "error" in response:
+                frappe.throw(response["error"].get("message", "Graph API error"))
+
+            backfilled_leads += store_fetched_leads(response.get("data", []), form, global_conf)
+
+            paging = response.get("paging", {})
+            cursor = paging.get("cursors", {}).get("after")
+            has_next = bool(paging.get("next") and cursor)
+
+            set_backfill_state(
+                form_name,
+                "Running" if has_next else "Completed",
+                backfill_cursor=cursor if has_next else None,
+                backfilled_leads=backfilled_leads
+            )
+            frappe.db.commit()
+
+            if not has_next:
+                frappe.logger().info(f"Backfill of Meta Lead Form {form_name} completed with {backfilled_leads} leads")
+                return
+
+    except Exception as e:
+        frappe.db.rollback()
+        set_backfill_state(form_name, "Failed")
+        frappe.db.commit()
+        frappe.logger().error(f"Backfill of Meta Lead Form {form_name} failed: {str(e)}", exc_info=True)
+
+
+def store_fetched_leads(leads, form, global_conf, source="Backfill"):
+    """Log leads of a form fetched from Meta and create their leads, returns the number of new logs."""
+    changes = [
+        {
+            "value": {
+                "leadgen_id": lead["id"],
+                "page_id": form.page,
+                "form_id": form.form_id,
+                "ad_id": lead.get("ad_id"),
+                "created_time": int(get_datetime(lead["created_time"]).timestamp())
+            }
+        }
+        for lead in leads
+    ]
+    if not changes:
+        return 0
+
+    # The fetched leads already hold their details, so they're stored right away and not fetched again
+    log_names = create_lead_logs_in_bulk(
+        changes,
+        global_conf,
+        source=source,
+        lead_payloads={lead["id"]: lead for lead in leads},
+        dispatch=False
+    )
+    process_lead_logs_in_batches([frappe.get_doc("Meta Webhook Lead Logs", log_name) for log_name in log_names])
+    return len(log_names)
+
+
+def set_backfill_state(form_name, status, **values):
+    frappe.db.set_value(
+        "Meta Lead Form",
+        form_name,
+        {"backfill_status": status, "backfill_updated_at": now_datetime(), **values},
+        update_modified=False
+    )
+
+
+def resume_stalled_backfills():
+    """
+    Hourly. Re-queue backfills whose job is gone, e.g. killed by the queue timeout or a worker
+    restart, they continue from the stored cursor.
+    """
+    stalled_before = add_to_date(now_datetime(), seconds=-(get_queues_timeout()[BACKFILL_QUEUE] + BACKFILL_TIMEOUT_MARGIN))
+    forms = frappe.get_all(
+        "Meta Lead Form",
+        filters={"backfill_status": ["in", ["Queued", "Running"]], "backfill_updated_at": ["<", stalled_before]},
+        pluck="name"
+    )
+    for form_name in forms:
+        enqueue_lead_backfill(form_name)
@@ -0,0 +1,63 @@
+import hashlib
+import json
+
+import frappe
+from frappe.utils import cint, nowdate
+
+# Bumped when lead logs change, cached chart results of older versions are no longer read
+CHART_CACHE_VERSION_KEY = "onelead:chart_cache_version"
+
+DEFAULT_CHART_CACHE_TTL = 300
+
+
+def get_cached_chart(source, build, no_cache=None, **args):
+    """
+    Return `build(**args)` for a dashboard chart source, cached for `chart_cache_ttl` seconds.
+
+    Results are keyed by the chart arguments and dropped as soon as lead logs change.
+    `no_cache` computes the chart and refreshes the cached result.
+    """
+    ttl = get_chart_cache_ttl()
+    if not ttl:
+        return build(**args)
+
+    key = get_chart_cache_key(source, args)
+    if not cint(no_cache):
+        data = frappe.cache.get_value(key)
+        if data is not None:
+            return data
+
+    data = build(**args)
+    frappe.cache.set_value(key, data, expires_in_sec=ttl)
+    return data
+
+
+def get_chart_cache_key(source, args):
+    version = int(frappe.cache.get(frappe.cache.make_key(CHART_CACHE_VERSION_KEY)) or 0)
+    # Default timespans are relative to today
+    args_hash = hashlib.sha1(json.dumps([nowdate(), args], sort_keys=True, default=str).encode()).hexdigest()
+    return f"onelead:chart:{source}:{version}:{args_hash}"
+
+
+def get_chart_cache_ttl():
+    ttl = frappe.get_cached_doc("Meta Webhook Config").chart_cache_ttl
+    return DEFAULT_CHART_CACHE_TTL if ttl is None else cint(ttl)
+
+
+def invalidate_chart_cache():
+    """Drop the cached chart results once the current transaction commits, once per transaction."""
+    if frappe.flags.onelead_chart_cache_invalidated:
+        return
+
+    frappe.flags.onelead_chart_cache_invalidated = True
+    frappe.db.after_commit.add(bump_chart_cache_version)
+    frappe.db.after_rollback.add(reset_chart_cache_flag)
+
+
+def bump_chart_cache_version():
+    reset_chart_cache_flag()
+    frappe.cache.incr(frappe.cache.make_key(CHART_CACHE_VERSION_KEY))
+
+
+def reset_chart_cache_flag():
+    frappe.flags.onelead_chart_cache_invalidated = False
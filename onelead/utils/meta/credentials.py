@@ -0,0 +1,65 @@
+import frappe
+from frappe.utils.password import get_decrypted_password
+
+# Decrypted secrets are kept per worker process, never in Redis.
+# Redis only holds a version number that is bumped whenever a doc owning a secret is saved,
+# so every worker drops its copy on the next read after a change.
+CREDENTIALS_VERSION_KEY = "onelead:credentials_version"
+
+_credentials_cache = {}
+
+
+def get_meta_credentials():
+    """
+    Return the app and user credentials of Meta Webhook Config, decrypted once per worker.
+
+    Returns:
+        frappe._dict: app_id, app_secret and user_access_token.
+    """
+    def load():
+        return {
+            "app_id": frappe.db.get_single_value("Meta Webhook Config", "app_id"),
+            "app_secret": get_decrypted_password("Meta Webhook Config", "Meta Webhook Config", "app_secret", raise_exception=False),
+            "user_access_token": get_decrypted_password("Meta Webhook Config", "Meta Webhook Config", "user_access_token", raise_exception=False),
+        }
+
+    return frappe._dict(get_cached_credentials("Meta Webhook Config", "Meta Webhook Config", load))
+
+
+def get_page_access_token(page_id):
+    """Return the decrypted page access token of a Meta Page, None if the page has no token."""
+    def load():
+        return {
+            "page_access_token": get_decrypted_password("Meta Page", page_id, "page_access_token", raise_exception=False)
+        }
+
+    return get_cached_credentials("Meta Page", page_id, load).get("page_access_token")
+
+
+def get_cached_credentials(doctype, name, loader):
+    """Return credentials of a doc from the worker cache, calling `loader` on a miss or after a change."""
+    version = get_credentials_version()
+    key = (frappe.local.site, doctype, name)
+
+    cached = _credentials_cache.get(key)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    values = loader()
+    _credentials_cache[key] = (version, values)
+    return values
+
+
+def get_credentials_version():
+    return int(frappe.cache.get(frappe.cache.make_key(CREDENTIALS_VERSION_KEY)) or 0)
+
+
+def clear_credentials_cache(doc=None, method=None, *args):
+    """Invalidate cached credentials in every worker, hooked on docs that own a secret."""
+    _credentials_cache.clear()
+    # Bump only once the new secret is committed, else another worker could cache the old one again
+    frappe.db.after_commit.add(bump_credentials_version)
+
+
+def bump_credentials_version():
+    frappe.cache.incr(frappe.cache.make_key(CREDENTIALS_VERSION_KEY))
@@ -0,0 +1,231 @@
+import json
+import threading
+import time
+
+import frappe
+import requests
+from requests.adapters import HTTPAdapter
+from facebook_business.api import FacebookAdsApi
+from facebook_business.exceptions import FacebookRequestError
+from facebook_business.session import FacebookSession
+
+# (connect, read) timeout in seconds for every Graph API call
+GRAPH_TIMEOUT = (10, 60)
+
+# Keep-alive connections kept per host, enough for the parallel fetches of the poller
+GRAPH_POOL_SIZE = 20
+
+# Shared call budget of all workers, a token bucket kept in Redis.
+# Calls per second and burst size while Meta reports a low usage.
+GRAPH_RATE = 20
+GRAPH_BURST = 40
+
+# Usage (percent of a Meta limit) from which callers are slowed down, and paused
+USAGE_SLOWDOWN = 75
+USAGE_PAUSE = 95
+
+# Error codes of Meta's app, user, page and business use case rate limits
+THROTTLE_ERROR_CODES = {4, 17, 32, 613, 80000, 80001, 80002, 80003, 80004, 80005, 80006, 80008, 80009, 80014}
+
+# Pause when throttled and Meta doesn't say for how long, in seconds
+THROTTLE_PAUSE = 300
+
+# Longest a background job waits for the budget before giving up, in seconds
+GRAPH_MAX_WAIT = 900
+
+# Same for web requests, which must answer well within the gunicorn timeout
+GRAPH_MAX_WAIT_WEB = 5
+
+RATE_LIMIT_KEY = "onelead:graph_rate_limit"
+
+# Refills the bucket for the time passed and takes `cost` tokens when enough are left.
+# Returns the seconds to wait before trying again, 0 when the tokens were taken.
+TOKEN_BUCKET_SCRIPT = """
+local rate, burst, now, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local state = redis.call('hmget', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('hset', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('expire', KEYS[1], 3600)
+return tostring(wait)
+"""
+
+
+class GraphRateLimited(Exception):
+    pass
+
+
+class RateLimitedFacebookAdsApi(FacebookAdsApi):
+    """FacebookAdsApi waiting for the shared call budget before each call, and reporting Meta's usage back to it."""
+
+    def call(self, *args, **kwargs):
+        acquire_graph_call()
+        try:
+            response = super().call(*args, **kwargs)
+        except FacebookRequestError as e:
+            record_graph_usage(e.http_headers() or {}, e.api_error_code())
+            raise
+        record_graph_usage(response.headers() or {})
+        return response
+
+
+_graph_apis = {}
+_http_session = None
+_lock = threading.Lock()
+
+
+def get_graph_api(access_token, app_id=None, app_secret=None):
+    """
+    Return the Graph API client of this worker for a token, creating it on first use.
+
+    The client keeps its `requests` session, so connections to graph.facebook.com stay
+    open (and TLS sessions are reused) across calls instead of being set up by every
+    `FacebookAdsApi.init`. Pass it to the SDK objects, e.g. `Page(page_id, api=api)`.
+    """
+    key = (access_token, app_id, app_secret)
+    api = _graph_apis.get(key)
+    if api:
+        return api
+
+    with _lock:
+        api = _graph_apis.get(key)
+        if not api:
+            session = FacebookSession(app_id, app_secret, access_token, timeout=GRAPH_TIMEOUT)
+            mount_pool(session.requests)
+            api = RateLimitedFacebookAdsApi(session)
+            _graph_apis[key] = api
+    return api
+
+
+def get_http_session():
+    """Return the pooled `requests` session of this worker, for plain Graph API HTTP calls."""
+    global _http_session
+    if not _http_session:
+        with _lock:
+            if not _http_session:
+                _http_session = mount_pool(requests.Session())
+    return _http_session
+
+
+def graph_get(url, params=None, max_wait=None):
+    """GET a Graph API url through the pooled session and return the decoded JSON."""
+    acquire_graph_call(max_wait=max_wait)
+    response = get_http_session().get(url, params=params, timeout=GRAPH_TIMEOUT)
+    data = response.json()
+    error_code = data.get("error", {}).get("code") if isinstance(data, dict) else None
+    record_graph_usage(response.headers, error_code)
+    return data
+
+
+def mount_pool(session):
+    adapter = HTTPAdapter(pool_connections=GRAPH_POOL_SIZE, pool_maxsize=GRAPH_POOL_SIZE)
+    session.mount("https://", adapter)
+    return session
+
+
+def acquire_graph_call(cost=1, max_wait=None):
+    """
+    Block until the shared budget allows a Graph API call.
+    Waits out a pause set after Meta reported a usage close to its limits or throttled a call.
+
+    Raises GraphRateLimited when the call can't be made within `max_wait` seconds, which defaults to
+    GRAPH_MAX_WAIT_WEB in web requests and GRAPH_MAX_WAIT in background jobs.
+    """
+    if max_wait is None:
+        max_wait = GRAPH_MAX_WAIT_WEB if getattr(frappe.local, "request", None) else GRAPH_MAX_WAIT
+
+    deadline = time.monotonic() + max_wait
+    bucket = frappe.cache.register_script(TOKEN_BUCKET_SCRIPT)
+    while True:
+        paused_for = get_graph_pause()
+        if not paused_for:
+            wait = float(bucket(
+                keys=[rate_limit_key("bucket")],
+                args=[GRAPH_RATE * get_usage_factor(), GRAPH_BURST, time.time(), cost]
+            ))
+            if not wait:
+                return
+        else:
+            wait = paused_for
+
+        if time.monotonic() + wait > deadline:
+            raise GraphRateLimited(f"Graph API calls are paused by the rate limit for {int(wait)} more seconds")
+        time.sleep(wait)
+
+
+def record_graph_usage(headers, error_code=None):
+    """Update the shared usage from the X-App-Usage / X-Business-Use-Case-Usage headers of a response."""
+    usage, regain_after = parse_usage_headers(headers)
+    if usage is not None:
+        frappe.cache.set(rate_limit_key("usage"), usage, ex=300)
+
+    if error_code in THROTTLE_ERROR_CODES:
+        pause_graph_calls(regain_after or THROTTLE_PAUSE)
+    elif regain_after or (usage or 0) >= USAGE_PAUSE:
+        pause_graph_calls(regain_after or 60)
+
+
+def parse_usage_headers(headers):
+    """
+    Return the highest usage percent reported in the headers and the seconds until access is
+    regained when Meta says so, (None, 0) if the headers carry no usage.
+    """
+    usages = []
+    regain_after = 0
+
+    app_usage = load_usage_header(headers.get("X-App-Usage"))
+    if isinstance(app_usage, dict):
+        usages.extend(app_usage.get(metric) or 0 for metric in ("call_count", "total_cputime", "total_time"))
+
+    business_usage = load_usage_header(headers.get("X-Business-Use-Case-Usage"))
+    if isinstance(business_usage, dict):
+        for entries in business_usage.values():
+            for entry in entries:
+                usages.extend(entry.get(metric) or 0 for metric in ("call_count", "total_cputime", "total_time"))
+                # Meta gives this in minutes
+                regain_after = max(regain_after, (entry.get("estimated_time_to_regain_access") or 0) * 60)
+
+    return (max(usages) if usages else None), regain_after
+
+
+def load_usage_header(value):
+    if not value:
+        return None
+    try:
+        return json.loads(value)
+    except ValueError:
+        return None
+
+
+def get_usage_factor():
+    """Share of GRAPH_RATE allowed for the current usage, going down to 10% near USAGE_PAUSE."""
+    usage = float(frappe.cache.get(rate_limit_key("usage")) or 0)
+    if usage < USAGE_SLOWDOWN:
+        return 1
+    return max(0.1, (USAGE_PAUSE - usage) / (USAGE_PAUSE - USAGE_SLOWDOWN))
+
+
+def pause_graph_calls(seconds):
+    pause_until = time.time() + seconds
+    current = float(frappe.cache.get(rate_limit_key("paused_until")) or 0)
+    if pause_until > current:
+        frappe.cache.set(rate_limit_key("paused_until"), pause_until, ex=int(seconds) + 1)
+        frappe.logger().warning(f"Graph API calls paused for {int(seconds)} seconds by the rate limit")
+
+
+def get_graph_pause():
+    """Seconds left of the current pause, 0 if calls aren't paused."""
+    paused_until = float(frappe.cache.get(rate_limit_key("paused_until")) or 0)
+    return max(0, paused_until - time.time())
+
+
+def rate_limit_key(suffix):
+    # Meta's limits are per app, the state is still kept per site like the rest of the cache
+    return frappe.cache.make_key(f"{RATE_LIMIT_KEY}:{suffix}")
@@ -0,0 +1,80 @@
+import frappe
+from collections import defaultdict
+
+from .lead_stats import get_rollup_checkpoint, restore_rollup_checkpoint
+from .manage_leads import build_lead_doc, mark_lead_error, mark_lead_processed, prepare_logged_lead
+
+# Leads inserted per transaction
+LEAD_BATCH_SIZE = 200
+
+LEAD_BATCH_SAVEPOINT = "onelead_lead_batch"
+LEAD_ROW_SAVEPOINT = "onelead_lead_row"
+
+
+def process_lead_logs_in_batches(docs, batch_size=LEAD_BATCH_SIZE):
+    """
+    Create the leads of many Meta Webhook Lead Logs with one commit per chunk.
+
+    Mapped leads are grouped per lead doctype and inserted in chunks of `batch_size`. If a
+    lead of a chunk fails, the chunk is rolled back and retried lead by lead, so only the
+    failing leads are marked as Error.
+    """
+    meta_config = frappe.get_cached_doc("Meta Webhook Config")
+    frappe.set_user(meta_config.lead_creator or "Administrator")
+
+    for chunk in chunked(docs, batch_size):
+        leads_by_doctype = defaultdict(list)
+        for doc in chunk:
+            try:
+                prepared = prepare_logged_lead(doc, meta_config, commit=False)
+                if prepared:
+                    lead_data, form_config = prepared
+                    lead_doc = build_lead_doc(lead_data, form_config, doc)
+                    leads_by_doctype[lead_doc.doctype].append((doc, lead_doc))
+            except Exception as e:
+                mark_lead_error(doc, str(e))
+                frappe.logger().error(f"Error in processing lead for leadgen_id {doc.leadgen_id}: {str(e)}", exc_info=True)
+
+        for leads in leads_by_doctype.values():
+            insert_leads(leads)
+
+        frappe.db.commit()
+
+
+def insert_leads(leads):
+    """Insert (log doc, lead doc) pairs in the current transaction, falling back to one by one on error."""
+    # Rollup changes are kept in memory until the commit, they're rolled back along with the savepoints
+    frappe.db.savepoint(LEAD_BATCH_SAVEPOINT)
+    rollup_checkpoint = get_rollup_checkpoint()
+    try:
+        for doc, lead_doc in leads:
+            lead_doc.insert(ignore_permissions=True)
+            mark_lead_processed(doc, lead_doc)
+        return
+    except Exception as e:
+        frappe.db.rollback(save_point=LEAD_BATCH_SAVEPOINT)
+        restore_rollup_checkpoint(rollup_checkpoint)
+        frappe.logger().warning(f"Lead batch of {len(leads)} failed, retrying one by one: {str(e)}")
+        # The logs in memory still hold what was rolled back, e.g. their rollup_key
+        for doc, _ in leads:
+            doc.reload()
+
+    for doc, lead_doc in leads:
+        frappe.db.savepoint(LEAD_ROW_SAVEPOINT)
+        rollup_checkpoint = get_rollup_checkpoint()
+        try:
+            # The batch attempt may have named and inserted this doc before it was rolled back
+            lead_doc = frappe.copy_doc(lead_doc)
+            lead_doc.insert(ignore_permissions=True)
+            mark_lead_processed(doc, lead_doc)
+        except Exception as e:
+            frappe.db.rollback(save_point=LEAD_ROW_SAVEPOINT)
+            restore_rollup_checkpoint(rollup_checkpoint)
+            doc.reload()
+            mark_lead_error(doc, str(e))
+            frappe.logger().error(f"Error creating lead document for leadgen_id {doc.leadgen_id}: {str(e)}", exc_info=True)
+
+
+def chunked(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
@@ -0,0 +1,248 @@
+import hashlib
+from collections import Counter
+
+import frappe
+from frappe.utils import getdate, now
+
+from .chart_cache import invalidate_chart_cache
+
+# Lead log fields the rollup is keyed by, `created_time` is counted per day
+ROLLUP_DIMENSIONS = ("created_time", "platform", "processing_status", "lead_form", "ads", "campaign")
+
+# SQL computing the same key as `get_rollup_key` from a lead log row, for queries without parameters
+ROLLUP_KEY_SQL = """SHA1(CONCAT_WS('|',
+    IFNULL(DATE_FORMAT(created_time, '%Y-%m-%d'), ''), IFNULL(platform, ''), IFNULL(processing_status, ''),
+    IFNULL(lead_form, ''), IFNULL(ads, ''), IFNULL(campaign, '')
+))"""
+
+# Lead logs counted in the rollup, archived logs stay counted
+LEAD_LOGS_SQL = """(
+    SELECT created_time, platform, processing_status, lead_form, ads, campaign FROM `tabMeta Webhook Lead Logs`
+    UNION ALL
+    SELECT created_time, platform, processing_status, lead_form, ads, campaign FROM `tabLead Log Archive`
+    WHERE source_doctype = 'Meta Webhook Lead Logs'
+) logs"""
+
+# Status counter of lead logs without a processing status
+STATUS_NOT_SET = "Not Set"
+
+
+def get_rollup_dimensions(log):
+    """Return the rollup dimensions of a lead log (doc or dict) as strings, '' for unset ones."""
+    created_time = log.get("created_time")
+    return (
+        getdate(created_time).isoformat() if created_time else "",
+        *(log.get(field) or "" for field in ROLLUP_DIMENSIONS[1:])
+    )
+
+
+def get_rollup_key(dimensions):
+    return hashlib.sha1("|".join(dimensions).encode()).hexdigest()
+
+
+def track_lead_log(doc):
+    """
+    Move a lead log to the rollup row of its current dimensions, called on every change of the log.
+    The move is applied once the transaction commits, see `queue_rollup_deltas`.
+    """
+    dimensions = get_rollup_dimensions(doc)
+    rollup_key = get_rollup_key(dimensions)
+    if rollup_key == doc.rollup_key:
+        return
+
+    deltas = Counter({rollup_key: 1})
+    if doc.rollup_key:
+        deltas[doc.rollup_key] -= 1
+    queue_rollup_deltas(deltas, {rollup_key: dimensions})
+
+    frappe.db.set_value(doc.doctype, doc.name, "rollup_key", rollup_key, update_modified=False)
+    doc.rollup_key = rollup_key
+
+
+def untrack_lead_log(doc):
+    if doc.rollup_key:
+        queue_rollup_deltas(Counter({doc.rollup_key: -1}))
+
+
+def add_to_rollups(counts):
+    """Count new lead logs, {dimensions: count}, in the rollup once the transaction commits."""
+    keys = {get_rollup_key(dimensions): dimensions for dimensions in counts}
+    queue_rollup_deltas(Counter({key: counts[dimensions] for key, dimensions in keys.items()}), keys)
+
+
+def queue_rollup_deltas(deltas, dimensions=None):
+    """
+    Note rollup changes of the current transaction, {rollup key: delta}, along with the dimensions
+    of keys that may be new. They're netted and applied by `apply_rollup_deltas` after the commit,
+    so a long transaction doesn't hold the few hot rollup and counter rows locked. A rollback drops them.
+    """
+    state = frappe.flags.onelead_rollup_deltas
+    if state is None:
+        state = frappe.flags.onelead_rollup_deltas = frappe._dict(deltas=Counter(), dimensions={})
+        frappe.db.after_commit.add(apply_rollup_deltas)
+        frappe.db.after_rollback.add(discard_rollup_deltas)
+
+    state.deltas.update(deltas)
+    state.dimensions.update(dimensions or {})
+
+
+def get_rollup_checkpoint():
+    """Copy of the pending rollup changes, restored with `restore_rollup_checkpoint` after rolling back to a savepoint."""
+    state = frappe.flags.onelead_rollup_deltas
+    return Counter(state.deltas) if state else Counter()
+
+
+def restore_rollup_checkpoint(checkpoint):
+    state = frappe.flags.onelead_rollup_deltas
+    if state:
+        state.deltas = Counter(checkpoint)
+
+
+def discard_rollup_deltas():
+    frappe.flags.onelead_rollup_deltas = None
+
+
+def apply_rollup_deltas():
+    """Apply the netted rollup changes of a committed transaction, in a short transaction of their own."""
+    state = frappe.flags.onelead_rollup_deltas
+    frappe.flags.onelead_rollup_deltas = None
+    deltas = {key: delta for key, delta in state.deltas.items() if delta} if state else {}
+    if not deltas:
+        return
+
+    # Rows logs only moved out of exist already, their status is read before they change
+    known = {key: state.dimensions[key] for key in deltas if key in state.dimensions}
+    existing = sorted(key for key in deltas if key not in known)
+    statuses = {}
+    if existing:
+        statuses = dict(frappe.db.sql(
+            "SELECT name, processing_status FROM `tabMeta Lead Rollup` WHERE name IN %s", (tuple(existing),)
+        ))
+
+    status_counts = Counter()
+    for key, dimensions in known.items():
+        status_counts[dimensions[2] or STATUS_NOT_SET] += deltas[key]
+    for key, status in statuses.items():
+        status_counts[status or STATUS_NOT_SET] += deltas[key]
+
+    write_rollup_rows({dimensions: deltas[key] for key, dimensions in known.items()})
+    timestamp = now()
+    for key in statuses:
+        frappe.db.sql(
+            "UPDATE `tabMeta Lead Rollup` SET lead_count = lead_count + %s, modified = %s WHERE name = %s",
+            (deltas[key], timestamp, key),
+        )
+    write_status_counters({status: count for status, count in status_counts.items() if count})
+    invalidate_chart_cache()
+    frappe.db.commit()
+
+
+def write_rollup_rows(counts):
+    """Add {dimensions: count} to the rollup, creating missing rows, in one statement."""
+    if not counts:
+        return
+
+    timestamp = now()
+    user = frappe.session.user
+    values = []
+    for dimensions, count in counts.items():
+        day = dimensions[0] or None
+        values.append((get_rollup_key(dimensions), timestamp, timestamp, user, user, day, *dimensions[1:], count))
+    # Rows are always locked in key order, concurrent writers can't deadlock on them
+    values.sort()
+
+    placeholders = ", ".join(["(%s, %s, %s, %s, %s, 0, 0, %s, %s, %s, %s, %s, %s, %s)"] * len(values))
+    frappe.db.sql(
+        f"""
+        INSERT INTO `tabMeta Lead Rollup`
+            (name, creation, modified, owner, modified_by, docstatus, idx,
+            day, platform, processing_status, lead_form, ads, campaign, lead_count)
+        VALUES {placeholders}
+        ON DUPLICATE KEY UPDATE lead_count = lead_count + VALUES(lead_count), modified = VALUES(modified)
+        """,
+        [value for row in values for value in row],
+    )
+
+
+def write_status_counters(counts):
+    """Add {status: count} to the status counters, creating missing rows, in one statement."""
+    if not counts:
+        return
+
+    timestamp = now()
+    user = frappe.session.user
+    values = sorted((status, timestamp, timestamp, user, user, status, count) for status, count in counts.items())
+
+    placeholders = ", ".join(["(%s, %s, %s, %s, %s, 0, 0, %s, %s)"] * len(values))
+    frappe.db.sql(
+        f"""
+        INSERT INTO `tabMeta Lead Status Counter`
+            (name, creation, modified, owner, modified_by, docstatus, idx, processing_status, lead_count)
+        VALUES {placeholders}
+        ON DUPLICATE KEY UPDATE lead_count = lead_count + VALUES(lead_count), modified = VALUES(modified)
+        """,
+        [value for row in values for value in row],
+    )
+
+
+def rebuild_lead_rollup():
+    """
+    Recount the whole rollup from the lead logs and archived ones, and point every log at its rollup row.
+    Run it should the rollup ever drift: `bench execute onelead.utils.meta.lead_stats.rebuild_lead_rollup`
+    """
+    frappe.db.sql("DELETE FROM `tabMeta Lead Rollup`")
+    frappe.db.sql(
+        f"""
+        INSERT INTO `tabMeta Lead Rollup`
+            (name, creation, modified, owner, modified_by, docstatus, idx,
+            day, platform, processing_status, lead_form, ads, campaign, lead_count)
+        SELECT
+            {ROLLUP_KEY_SQL}, NOW(6), NOW(6), 'Administrator', 'Administrator', 0, 0,
+            DATE(created_time), IFNULL(platform, ''), IFNULL(processing_status, ''),
+            IFNULL(lead_form, ''), IFNULL(ads, ''), IFNULL(campaign, ''), COUNT(*)
+        FROM {LEAD_LOGS_SQL}
+        GROUP BY DATE(created_time), IFNULL(platform, ''), IFNULL(processing_status, ''),
+            IFNULL(lead_form, ''), IFNULL(ads, ''), IFNULL(campaign, '')
+        """
+    )
+    frappe.db.sql(f"UPDATE `tabMeta Webhook Lead Logs` SET rollup_key = {ROLLUP_KEY_SQL}")
+    rebuild_status_counters()
+
+
+def get_status_count(*statuses):
+    """Number of lead logs in any of `statuses`, from the status counters."""
+    return sum(
+        frappe.get_all(
+            "Meta Lead Status Counter", filters={"name": ["in", statuses]}, pluck="lead_count"
+        )
+    )
+
+
+def rebuild_status_counters():
+    """Recount the status counters from the lead logs and archived ones."""
+    status = get_status_counter_sql()
+    frappe.db.sql("DELETE FROM `tabMeta Lead Status Counter`")
+    frappe.db.sql(
+        f"""
+        INSERT INTO `tabMeta Lead Status Counter`
+            (name, creation, modified, owner, modified_by, docstatus, idx, processing_status, lead_count)
+        SELECT
+            {status}, NOW(6), NOW(6), 'Administrator', 'Administrator', 0, 0,
+            {status}, COUNT(*)
+        FROM {LEAD_LOGS_SQL}
+        GROUP BY {status}
+        """
+    )
+
+
+def get_status_counter_sql(column="processing_status"):
+    """SQL giving the status counter a lead log (or rollup row) is counted in."""
+    return f"IF(IFNULL({column}, '') = '', '{STATUS_NOT_SET}', {column})"
+
+
+@frappe.whitelist()
+def reconcile_status_counters():
+    """Recount the status counters on demand, e.g. should they have drifted from the lead logs."""
+    frappe.only_for("System Manager")
+    rebuild_status_counters()
+    frappe.msgprint("Lead status counters have been recounted.")
@@ -1,7 +1,5 @@
 import frappe
-import requests
 from datetime import datetime, timedelta
-from facebook_business.api import FacebookAdsApi
 from facebook_business.adobjects.user import User
 from facebook_business.adobjects.adaccount import AdAccount
 from facebook_business.adobjects.campaign import Campaign
@@ -9,7 +7,9 @@ from facebook_business.adobjects.ad import Ad
 from facebook_business.adobjects.leadgenform import LeadgenForm
 from facebook_business.adobjects.page import Page
 
-from frappe.utils.background_jobs import get_job
+from .credentials import get_meta_credentials, get_page_access_token
+from .graph_client import get_graph_api, graph_get
+from .synced_docs import get_synced_doc_state, get_synced_doc_states, iter_batches, upsert_synced_doc
 
 @frappe.whitelist()
 def get_latest_forms_for_page(page_id):
@@ -22,9 +22,12 @@ def get_latest_forms_for_page(page_id):
         frappe.throw("Failed to fetch forms for the page.")
 
 def is_token_short_lived(doc, user_access_token, app_access_token):
-    url = f"{doc.meta_url}/debug_token?input_token={user_access_token}&access_token={user_access_token}"
-    response = requests.get(url)
-    data = response.json()
+    url = f"{doc.meta_url}/debug_token"
+    data = graph_get(url, params={"input_token": user_access_token, "access_token": user_access_token})
+
+    # An error body (e.g. throttling) says nothing about the token itself
+    if "error" in data and not data.get("data"):
+        raise Exception(data["error"].get("message", "Graph API error"))
 
     if not data.get('data', {}).get("is_valid"):
         frappe.throw("User access token is invalid.")
@@ -57,11 +60,13 @@ def is_token_short_lived(doc, user_access_token, app_access_token):
             msg=f"The user Access Token is missing the following permissions: {', '.join(missing_permissions)}, please enter correct Token with all the permissions."
         )
 
-    is_short_lived = True if expires_in_days < 30 else False
+    # Tokens without an expiry never need an exchange
+    is_short_lived = True if expires_in_days is not None and expires_in_days < 30 else False
     res = {
         "is_short_lived": is_short_lived,
         "is_valid": token_data["is_valid"],
         "user_id": token_data.get("user_id"),
+        "expires_at": expires_at_timestamp,
     }
 
     return res
@@ -76,8 +81,7 @@ def get_long_lived_user_token(doc, user_access_token, app_secret, app_id):
             "client_secret": app_secret,
             "fb_exchange_token": user_access_token
         }
-        long_token_response = requests.get(url, params=params)
-        long_token_data = long_token_response.json()
+        long_token_data = graph_get(url, params=params)
         if "access_token" in long_token_data:
             # Update the token and new expiration
             long_lived_token = long_token_data["access_token"]
@@ -113,11 +117,11 @@ def get_long_lived_user_token(doc, user_access_token, app_secret, app_id):
         frappe.throw(f"Failed to exchange token: {str(e)}")
 
 def install_app_to_page(page_access_token, page_id, app_id):
-    # Initialize the API with the user access token
-    FacebookAdsApi.init(access_token=page_access_token)
+    # Initialize the API with the page access token
+    api = get_graph_api(page_access_token)
 
     # Create a Page object
-    page = Page(page_id)
+    page = Page(page_id, api=api)
     
     # Install the app on the Page with subscribed fields
     try:
@@ -138,26 +142,11 @@ def install_app_to_page(page_access_token, page_id, app_id):
         )
 
 def refresh_token():
+    """Check the user token from the cached token state, it's exchanged in the background when due."""
+    from .token_manager import ensure_token_valid
+
     try:
-        meta_config = frappe.get_single("Meta Webhook Config")
-        app_id = meta_config.app_id
-        app_secret = meta_config.get_password("app_secret")  # Automatically decrypts
-        user_token = meta_config.get_password("user_access_token")
-
-        # Check if all fields has data.
-        if not app_id or not app_secret or not user_token:
-            frappe.throw("App ID, App Secret, and User Token must all be provided in Meta Webhook Config.")
-
-        token_data = is_token_short_lived(meta_config, user_token, app_secret)
-        meta_config.user_id = token_data["user_id"]
-        if token_data["is_short_lived"]:
-            frappe.logger().info('Meta got short lived token, updating...')
-            long_token_data = get_long_lived_user_token(meta_config, user_token, app_secret, app_id)
-            user_token = long_token_data["access_token"]
-        else:
-            meta_config.is_token_valid = token_data["is_valid"]
-            meta_config.save(ignore_permissions=True)
-        frappe.db.commit()
+        ensure_token_valid()
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "Failed to Refresh Meta User Token")
         frappe.throw(f"Failed to connect to Meta API: {str(e)}")
@@ -208,32 +197,20 @@ def get_adaccounts():
     if not frappe.has_permission(doctype="Meta Webhook Config", ptype="read"):
         frappe.throw("You do not have permission to access Meta Webhook Config.")
     
-    meta_config = frappe.get_single("Meta Webhook Config")
-    app_id = meta_config.app_id
-    app_secret = meta_config.get_password("app_secret")  # Automatically decrypts
-    user_token = meta_config.get_password("user_access_token")
-    page_flow = meta_config.page_flow
+    # A freshly connected short-lived token is exchanged right away, other runs only read the cached check
+    from .token_manager import ensure_token_valid
+    ensure_token_valid(refresh_now=True)
 
-    # Check if all fields has data.
-    if not app_id or not app_secret or not user_token:
-        frappe.throw("App ID, App Secret, and User Token must all be provided in Meta Webhook Config.")
+    # Checked again when the run starts, this one saves the account fetch
+    from .sync import ensure_no_active_sync_run, start_sync_run
+    ensure_no_active_sync_run()
 
-    token_data = is_token_short_lived(meta_config, user_token, app_secret)
-    meta_config.user_id = token_data["user_id"]
-    if token_data["is_short_lived"]:
-        frappe.logger().info('Meta got short lived token, updating...')
-        long_token_data = get_long_lived_user_token(meta_config, user_token, app_secret, app_id)
-        user_token = long_token_data["access_token"]
-    else:
-        meta_config.is_token_valid = token_data["is_valid"]
-        meta_config.save(ignore_permissions=True)
-    frappe.db.commit()
-    
-    FacebookAdsApi.init(app_id, app_secret, user_token)
+    credentials = get_meta_credentials()
+    api = get_graph_api(credentials.user_access_token, credentials.app_id, credentials.app_secret)
     
     try:
         # Get the user object
-        user = User(fbid='me')
+        user = User(fbid='me', api=api)
         
         # Fetch Ad Accounts
         ad_accounts = user.get_ad_accounts(fields=[
@@ -250,122 +227,74 @@ def get_adaccounts():
             'business_zip'
         ])
         
-        for ad_account in ad_accounts:
-            # Check if the account has associated pages
+        # Each account, and each page in page flow, is synced by its own job
+        start_sync_run([ad_account.export_all_data() for ad_account in ad_accounts])
+        return "Success"
 
-            # pages = ad_account.get('promote_pages', {}).get("data", [])
+    except Exception as e:
+        frappe.log_error(frappe.get_traceback(), "Meta API Error")
+        frappe.throw(f"Failed to connect to Meta API: {str(e)}")
 
-            # if len(pages) == 0:
-            #     # Skip this ad account if there are no pages
-            #     continue
-            
-            # Extract details from the ad account
-            account_id = ad_account['account_id']
-            id = ad_account['id']
-            account_name = ad_account.get('name', 'No Name')
-            account_status = ad_account.get('account_status')
-            business_name = ad_account.get('business_name', 'No Business Name')
-            business_country_code = ad_account.get('business_country_code', '')
-            business_city = ad_account.get('business_city', '')
-            business_state = ad_account.get('business_state', '')
-            business_zip = ad_account.get('business_zip', '')
-            currency = ad_account.get('currency', '')
-            
-            # Create or update the Ad Account in Frappe
-            ad_account_doc = frappe.get_doc("Meta Ad Account", {"account_id": account_id}) if frappe.db.exists("Meta Ad Account", {"account_id": account_id}) else frappe.new_doc("Meta Ad Account")
-            ad_account_doc.update({
-                "account_id": account_id,
-                "act_id": id,
-                "account_name": account_name,
-                "account_status": account_status,
-                "business_name": business_name,
-                "business_country_code": business_country_code,
-                "business_city": business_city,
-                "business_state": business_state,
-                "business_zip": business_zip,
-                "currency": currency
-            })
 
-            # Fetch Pages for each Ad Account
-            ad_account_instance = AdAccount(id)
-            pages = ad_account_instance.get_promote_pages(fields=['id', 'name', 'access_token'])
+def sync_ad_account(ad_account):
+    """
+    Create or update a Meta Ad Account and its promoted Meta Pages.
+    In page flow the app is installed on each page as well.
 
-            page_obj = [{"id": page["id"], "name": page["name"], "access_token": page["access_token"]} for page in pages]
-            page_ids = [page["id"] for page in page_obj]  # Access as object attribute
+    Returns:
+        list: ids of the pages of the account.
+    """
+    credentials = get_meta_credentials()
+    app_id = credentials.app_id
+    api = get_graph_api(credentials.user_access_token, app_id, credentials.app_secret)
+    page_flow = frappe.db.get_single_value("Meta Webhook Config", "page_flow")
+
+    # Extract details from the ad account
+    account_id = ad_account['account_id']
+    id = ad_account['id']
+
+    ad_account_values = {
+        "account_id": account_id,
+        "act_id": id,
+        "account_name": ad_account.get('name', 'No Name'),
+        "account_status": ad_account.get('account_status'),
+        "business_name": ad_account.get('business_name', 'No Business Name'),
+        "business_country_code": ad_account.get('business_country_code', ''),
+        "business_city": ad_account.get('business_city', ''),
+        "business_state": ad_account.get('business_state', ''),
+        "business_zip": ad_account.get('business_zip', ''),
+        "currency": ad_account.get('currency', '')
+    }
 
-            # Add associated pages to child table in Ad Account Config
-            for page in page_obj:
-                page_id = page["id"]
-                page_access_token = page.get("access_token")
+    # Fetch Pages for each Ad Account
+    ad_account_instance = AdAccount(id, api=api)
+    pages = ad_account_instance.get_promote_pages(fields=['id', 'name', 'access_token'])
 
-                # make entry or update Meta Page DocType
-                page_doc = frappe.get_doc("Meta Page", {"page_id": page_id}) if frappe.db.exists("Meta Page", {"page_id": page_id}) else frappe.new_doc("Meta Page")
-                page_doc.update({
-                    "page_name": page.get("name", "No Name Found"),
-                    "page_id": page.get("id"),
-                    "page_access_token": page_access_token
-                })
-                page_doc.save(ignore_permissions=True)
+    page_obj = [{"id": page["id"], "name": page["name"], "access_token": page["access_token"]} for page in pages]
+    page_ids = [page["id"] for page in page_obj]  # Access as object attribute
 
-                # If page_flow is enabled, create/update Meta Ads Page Config and get page access token
-                if page_flow:
-                    # Install app on page and get page access token
-                    install_app_to_page(page_access_token, page_id, app_id)
-                        
-                    # fetch_form_job_id = f"fetch_forms_{ad_account['account_id']}_{page_id}"
-                    # existing_job = get_job(fetch_form_job_id)
-
-                    # if existing_job and existing_job.get_status() in ('queued', 'started'):
-                    #     frappe.logger().info(f"Job with job_id '{fetch_form_job_id}' is already in the queue or running.")
-                    # else:
-                    #     frappe.enqueue(
-                    #         'onelead.utils.meta.manage_ads.fetch_forms_based_on_page',
-                    #         page_id=page_id,
-                    #         job_id=fetch_form_job_id,
-                    #         enqueue_after_commit=True,
-                    #         queue='default' # 300 Sec timeout
-                    #     )
-
-            if page_flow:
-                # job_id = f"fetch_campaigns_{ad_account['account_id']}"
-                # existing_job = get_job(job_id)
-
-                # if existing_job and existing_job.get_status() in ('queued', 'started'):
-                #     frappe.logger().info(f"Job with job_id '{job_id}' is already in the queue or running.")
-                # else:
-                #     frappe.enqueue(
-                #         'onelead.utils.meta.manage_ads.fetch_campaigns',
-                #         page_id='',
-                #         ad_account_id=ad_account['account_id'],
-                #         job_id=job_id,
-                #         enqueue_after_commit=True,
-                #         queue='default' # 300 Sec timeout
-                #     )
-
-                # page_flow_fetch_page_and_campaign(page_ids=page_ids, ad_account_id=ad_account["account_id"])
-                job_id = f"fetch_data_for_page_flow_{ad_account['account_id']}"
-                existing_job = get_job(job_id)
-
-                if existing_job and existing_job.get_status() in ('queued', 'started'):
-                    frappe.logger().info(f"Job with job_id '{job_id}' is already in the queue or running.")
-                else:
-                    frappe.enqueue(
-                        'onelead.utils.meta.manage_ads.page_flow_fetch_page_and_campaign',
-                        page_ids=page_ids,
-                        ad_account_id=ad_account['account_id'],
-                        job_id=job_id,
-                        queue='long' # 300 Sec timeout
-                    )
-
-            # Save the Ad Account
-            ad_account_doc.save(ignore_permissions=True)
-        
-        frappe.db.commit()
-        return "Success"
+    existing_pages = get_synced_doc_states("Meta Page", "page_id", page_ids)
 
-    except Exception as e:
-        frappe.log_error(frappe.get_traceback(), "Meta API Error")
-        frappe.throw(f"Failed to connect to Meta API: {str(e)}")
+    # Add associated pages to child table in Ad Account Config
+    for page in page_obj:
+        page_id = page["id"]
+        page_access_token = page.get("access_token")
+
+        # make entry or update Meta Page DocType, skipped if nothing changed
+        upsert_synced_doc("Meta Page", {
+            "page_name": page.get("name", "No Name Found"),
+            "page_id": page.get("id"),
+            "page_access_token": page_access_token
+        }, existing=existing_pages.get(page_id))
+
+        # If page_flow is enabled, install app on page
+        if page_flow:
+            install_app_to_page(page_access_token, page_id, app_id)
+
+    # Create or update the Ad Account, skipped if nothing changed
+    upsert_synced_doc("Meta Ad Account", ad_account_values, existing=get_synced_doc_state("Meta Ad Account", "account_id", account_id))
+    frappe.db.commit()
+    return page_ids
 
 
 @frappe.whitelist()
@@ -379,20 +308,20 @@ def fetch_campaigns(page_id, ad_account_id, page_flow=False):
         frappe.throw("You do not have permission to access Meta Webhook Config.")
     
     # Get the user token and app credentials from Meta Webhook Config
-    meta_config = frappe.get_single("Meta Webhook Config")
-    app_id = meta_config.app_id
-    app_secret = meta_config.get_password("app_secret")
-    user_token = meta_config.get_password("user_access_token")
+    credentials = get_meta_credentials()
+    app_id = credentials.app_id
+    app_secret = credentials.app_secret
+    user_token = credentials.user_access_token
 
     # Check if all fields has data.
     if not app_id or not app_secret or not user_token:
         frappe.throw("App ID, App Secret, and User Token must all be provided in Meta Webhook Config.")
     
     # Initialize the Facebook API
-    FacebookAdsApi.init(app_id, app_secret, user_token)
+    api = get_graph_api(user_token, app_id, app_secret)
     
     try:
-        ad_account = AdAccount(f'act_{ad_account_id}')
+        ad_account = AdAccount(f'act_{ad_account_id}', api=api)
         
         # Start fetching campaigns
         params = {'limit': 100 }
@@ -402,9 +331,10 @@ def fetch_campaigns(page_id, ad_account_id, page_flow=False):
         campaigns_cursor = ad_account.get_campaigns(fields=fields, params=params)
 
         campaign_to_form_dict = {}
-        while True:
-            # Loop through each campaign and save it in Meta Campaign DocType
-            for campaign in campaigns_cursor:
+        # Loop through each page of campaigns and save them in Meta Campaign DocType
+        for campaigns in iter_batches(campaigns_cursor):
+            campaign_docs = []
+            for campaign in campaigns:
                 campaign_id = campaign['id']
                 campaign_name = campaign.get('name', 'No Name')
                 campaign_objective = campaign.get('objective')
@@ -425,12 +355,8 @@ def fetch_campaigns(page_id, ad_account_id, page_flow=False):
                 if stop_time:
                     doc_dict["stop_time"] = datetime.strptime(stop_time, "%Y-%m-%dT%H:%M:%S%z").date()
 
-                # Create or update Meta Campaign document
-                campaign_doc = frappe.get_doc("Meta Campaign", {"campaign_id": campaign_id}) if frappe.db.exists("Meta Campaign", {"campaign_id": campaign_id}) else frappe.new_doc("Meta Campaign")
-                campaign_doc.update(doc_dict)
-                campaign_doc.save(ignore_permissions=True)
-
-                # Process ads associated with this campaign
+                # Collect the ads first, so the campaign is written once with its has_lead_form
+                ad_doc_dicts = []
                 ads = campaign.get("ads", [])
                 for ad in ads:
                     ad_id = ad["id"]
@@ -441,7 +367,6 @@ def fetch_campaigns(page_id, ad_account_id, page_flow=False):
                     has_lead_form = False
                     if ad.get("creative") and ad["creative"].get("object_story_spec"):
                         object_story_spec = ad["creative"].get("object_story_spec")
-                        # print("object_story_spec", object_story_spec)
                         call_to_actions = find_call_to_action(object_story_spec.export_all_data())
                         
                         if len(call_to_actions) > 0:
@@ -453,31 +378,31 @@ def fetch_campaigns(page_id, ad_account_id, page_flow=False):
                                     }
 
                             has_lead_form = True
-                            campaign_doc.set("has_lead_form", has_lead_form)
+                            doc_dict["has_lead_form"] = has_lead_form
 
                     # Prepare ad doc dictionary
-                    ad_doc_dict = {
+                    ad_doc_dicts.append({
                         "ads_id": ad_id,
                         "ads_name": ad_name,
                         "status": ad_status,
                         "campaign": campaign_id,
                         "has_lead_form": has_lead_form
-                    }
+                    })
+
+                campaign_docs.append((doc_dict, ad_doc_dicts))
+
+            # Resolve the campaigns and ads of the page already synced, in one query each
+            existing_campaigns = get_synced_doc_states("Meta Campaign", "campaign_id", [doc_dict["campaign_id"] for doc_dict, _ in campaign_docs])
+            existing_ads = get_synced_doc_states(
+                "Meta Ads", "ads_id", [ad_doc_dict["ads_id"] for _, ad_doc_dicts in campaign_docs for ad_doc_dict in ad_doc_dicts]
+            )
+
+            # Create or update Meta Campaign and its Meta Ads, unchanged ones are skipped
+            for doc_dict, ad_doc_dicts in campaign_docs:
+                upsert_synced_doc("Meta Campaign", doc_dict, existing=existing_campaigns.get(doc_dict["campaign_id"]))
+                for ad_doc_dict in ad_doc_dicts:
+                    upsert_synced_doc("Meta Ads", ad_doc_dict, existing=existing_ads.get(ad_doc_dict["ads_id"]))
 
-                    # Upsert Meta Ads document
-                    ad_doc = frappe.get_doc("Meta Ads", {"ads_id": ad_id}) if frappe.db.exists("Meta Ads", {"ads_id": ad_id}) else frappe.new_doc("Meta Ads")
-                    ad_doc.update(ad_doc_dict)
-                    ad_doc.save(ignore_permissions=True)
-                
-                campaign_doc.save(ignore_permissions=True)
-                # fetch_forms_based_on_selection(campaign_id, '', page_id=page_id)
-
-            # Check for next page
-            if campaigns_cursor.load_next_page():
-                campaigns_cursor = campaigns_cursor.next()
-            else:
-                break
-        
         frappe.db.commit()
 
         if page_flow:
@@ -500,38 +425,40 @@ def fetch_forms_based_on_selection(campaign_id, ad_account_id, page_id, ad_id=No
     #     frappe.throw("You do not have permission to access Meta Webhook Config.")
     
     # Get credentials from Meta Webhook Config
-    meta_config = frappe.get_single("Meta Webhook Config")
-    app_id = meta_config.app_id
-    app_secret = meta_config.get_password("app_secret")
-    user_token = meta_config.get_password("user_access_token")
+    credentials = get_meta_credentials()
+    app_id = credentials.app_id
+    app_secret = credentials.app_secret
+    user_token = credentials.user_access_token
     
     if not app_id or not app_secret or not user_token:
         frappe.throw("App ID, App Secret, and User Token must all be provided in Meta Webhook Config.")
     
     # Initialize the Facebook API
-    FacebookAdsApi.init(app_id, app_secret, user_token)
+    api = get_graph_api(user_token, app_id, app_secret)
     
     try:
         if ad_id:
             # Fetch forms based on the specific ad
-            ad = Ad(ad_id)
+            ad = Ad(ad_id, api=api)
             ad_data = ad.api_get(fields=['id', 'name', 'adcreatives.limit(100){object_story_spec}'])
             forms = extract_forms_from_ad(ad_data)
         else:
             # Fetch forms based on the campaign
-            campaign = Campaign(campaign_id)
+            campaign = Campaign(campaign_id, api=api)
             ads_data = campaign.get_ads(fields=['id', 'name', 'adcreatives.limit(100){object_story_spec}'], params={"limit": 100})
             forms = []
             for ad_data in ads_data:
                 forms.extend(extract_forms_from_ad(ad_data))
                 # print('forms gotten by extracting based on lead_gen_form_id', forms)
 
+        # Resolve the forms already fetched in one query
+        existing_forms = get_synced_doc_states("Meta Lead Form", "form_id", [form["id"] for form in forms])
+
         # Store forms in Meta Lead Form and Form List table
         for form in forms:
-            # if frappe.db.exists("Meta Lead Form", {"form_id": form["id"]}):
-                # print("Form already exists in Meta Lead Form: Form ID, ", form["id"])
             # Create or update Meta Lead Form DocType
-            form_doc = frappe.get_doc("Meta Lead Form", {"form_id": form["id"]}) if frappe.db.exists("Meta Lead Form", {"form_id": form["id"]}) else frappe.new_doc("Meta Lead Form")
+            existing_form = existing_forms.get(form["id"])
+            form_doc = frappe.get_doc("Meta Lead Form", existing_form.name) if existing_form else frappe.new_doc("Meta Lead Form")
 
             form_doc.update({
                 # "doctype": "Meta Lead Form",
@@ -631,24 +558,22 @@ def fetch_forms_based_on_page(page_id, campaign_to_form_dict=None):
         frappe.throw("You must be logged in to access this function.")
     
     # Retrieve the Meta Page to access the page token
-    try:
-        page_doc = frappe.get_doc("Meta Page", page_id)
-    except frappe.DoesNotExistError:
+    if not frappe.db.exists("Meta Page", page_id):
         frappe.throw(f"Meta Page with ID {page_id} does not exist.")
 
     # Retrieve the decrypted page access token
-    page_access_token = page_doc.get_password("page_access_token")
+    page_access_token = get_page_access_token(page_id)
     
 
     if not page_access_token:
         frappe.throw(f"Page Access Token is not available in Meta Page {page_id}. Ensure the page is properly connected.")
 
     # Initialize Facebook API with the page access token
-    FacebookAdsApi.init(access_token=page_access_token)
+    api = get_graph_api(page_access_token)
     
     try:
         # Initialize the Page object
-        page = Page(page_id)
+        page = Page(page_id, api=api)
         params = {'limit': 100}
         total_fetched = 0
         form_ids = []
@@ -657,20 +582,16 @@ def fetch_forms_based_on_page(page_id, campaign_to_form_dict=None):
         leadgen_forms = page.get_lead_gen_forms(fields=["id", "name", "status", "created_time"], params=params)
 
         # Paginate through lead generation forms
-        while True:
+        for forms in iter_batches(leadgen_forms):
+            # Resolve the forms of the page already synced in one query
+            existing_forms = get_synced_doc_states("Meta Lead Form", "form_id", [form["id"] for form in forms], ["question_fetched"])
+
             # Store fetched forms in Meta Lead Form DocType
-            for form in leadgen_forms:
+            for form in forms:
                 form_id = form["id"]
                 form_name = form.get("name", "Unnamed Form")
                 status = form.get("status", "")
 
-                # Create or update the form in Meta Lead Form DocType
-                form_exists = frappe.db.exists("Meta Lead Form", {"form_id": form_id})
-                form_doc = frappe.get_doc("Meta Lead Form", {"form_id": form_id}) if form_exists else frappe.new_doc("Meta Lead Form")
-                created_at = form.get("created_time", None)
-                if created_at:
-                    form_doc.created_at = datetime.strptime(created_at, "%Y-%m-%dT%H:%M:%S%z").strftime("%Y-%m-%d %H:%M:%S")
-
                 form_doc_payload = {
                     "form_id": form_id,
                     "form_name": form_name,
@@ -684,20 +605,27 @@ def fetch_forms_based_on_page(page_id, campaign_to_form_dict=None):
                     form_doc_payload["campaign"] = campaign_to_form_dict.get(form_id).get('id')
                 # print('added to form_ids', form_doc_payload)
 
-                form_doc.update(form_doc_payload)
-                form_doc.save(ignore_permissions=True)
+                form_doc_values = dict(form_doc_payload)
+                created_at = form.get("created_time", None)
+                if created_at:
+                    form_doc_values["created_at"] = datetime.strptime(created_at, "%Y-%m-%dT%H:%M:%S%z").strftime("%Y-%m-%d %H:%M:%S")
+
+                # Create or update the form in Meta Lead Form DocType, skipped if nothing changed.
+                # Forms without their questions are saved in full, so the before_save hook fetches them.
+                existing_form = existing_forms.get(form_id)
+                upsert_synced_doc(
+                    "Meta Lead Form",
+                    form_doc_values,
+                    existing=existing_form,
+                    full_save_fields=("campaign",),
+                    force_save=bool(existing_form and not existing_form.question_fetched)
+                )
                 # append with isNew flag
-                form_ids.append({"isNew": not form_exists, **form_doc_payload})
-                
+                form_ids.append({"isNew": not existing_form, **form_doc_payload})
+
             # Update total fetched count
-            total_fetched += len(leadgen_forms)
-            
-            # Check if there are more forms to fetch
-            if leadgen_forms.load_next_page():
-                leadgen_forms = leadgen_forms.next()
-            else:
-                break  # Exit loop if there are no more pages
-        
+            total_fetched += len(forms)
+
         frappe.db.commit()
         return form_ids
 
@@ -705,26 +633,6 @@ def fetch_forms_based_on_page(page_id, campaign_to_form_dict=None):
         frappe.log_error(frappe.get_traceback(), "Meta API Error")
         frappe.throw(f"Failed to fetch forms: {str(e)}")
 
-@frappe.whitelist()
-def page_flow_fetch_page_and_campaign(page_ids, ad_account_id):
-    try:
-        campaign_to_form_dict = {}
-        if ad_account_id:
-            campaign_to_form_dict = fetch_campaigns(page_id="", ad_account_id=ad_account_id, page_flow=True)
-
-        # print('Campaign form list', campaign_to_form_dict)
-        frappe.logger().info(f"campaign forms list {campaign_to_form_dict}")
-
-        for page_id in page_ids:
-            form_ids = fetch_forms_based_on_page(page_id=page_id, campaign_to_form_dict=campaign_to_form_dict)
-            create_meta_ads_page_config_doc(page_id, form_ids)
-
-        # fetch_forms_based_on_selection()
-
-    except Exception as e:
-        print(e)
-        frappe.log_error("page_flow_fetch_page_and_campaign", str(e))
-
 def find_call_to_action(data, depth=0, max_depth=6):
     """Recursively find all call_to_action objects in a nested structure.
         call_to_action can be in different ad object link_data, video_data,
@@ -788,21 +696,21 @@ def fetch_form_details(doc, method):
         return
     
     # Get Meta Webhook Config settings for credentials
-    meta_config = frappe.get_single("Meta Webhook Config")
-    app_id = meta_config.app_id
-    app_secret = meta_config.get_password("app_secret")
-    user_token = meta_config.get_password("user_access_token")
+    credentials = get_meta_credentials()
+    app_id = credentials.app_id
+    app_secret = credentials.app_secret
+    user_token = credentials.user_access_token
 
     # Check for missing credentials
     if not app_id or not app_secret or not user_token:
         frappe.throw("Meta API credentials are missing in Meta Webhook Config.")
     
     # Initialize the Facebook API
-    FacebookAdsApi.init(app_id, app_secret, user_token)
+    api = get_graph_api(user_token, app_id, app_secret)
     
     try:
         # Fetch form details using the Facebook API
-        lead_form = LeadgenForm(doc.form_id)
+        lead_form = LeadgenForm(doc.form_id, api=api)
         form_data = lead_form.api_get(fields=[
             'id', 'name', 'status', 'locale', 'questions', 'created_time'
         ])
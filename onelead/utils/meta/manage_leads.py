@@ -1,18 +1,22 @@
 import frappe
 import json
 from datetime import datetime
-from facebook_business.api import FacebookAdsApi
+from functools import partial
+from frappe.utils import now_datetime, time_diff_in_seconds
+from frappe.utils.background_jobs import get_queue, get_queues_timeout
 from facebook_business.adobjects.lead import Lead
-# from .. import formatting_functions
-from ..formatting_functions import FORMATTING_FUNCTIONS
-from ..meta_lead import get_lead_config
+from .mapping_plan import get_mapping_plan
+from ..meta_lead import get_lead_config, get_lead_payload_values
+from ..payload_codec import decode_payload
+from .credentials import get_meta_credentials
+from .graph_client import get_graph_api
 # from your_meta_sdk_module import MetaAdsAPI 
 
 
 # ================== Utility Functions ==================
 
-def ensure_campaign_exists(form_doc):
-    """Ensure a campaign exists for the given Meta Lead Form."""
+def ensure_campaign_exists(form_doc, commit=True):
+    """Ensure a campaign exists for the given Meta Lead Form. Pass `commit=False` to leave the commit to the caller."""
     try:
         # Generate campaign ID based on form name and form ID
         campaign_id = f"{form_doc.form_name.replace(' ', '_')}_{form_doc.form_id}"
@@ -39,7 +43,8 @@ def ensure_campaign_exists(form_doc):
         })
         
         new_campaign.insert(ignore_permissions=True)
-        frappe.db.commit()
+        if commit:
+            frappe.db.commit()
 
         return new_campaign.name  # Return new campaign ID
 
@@ -47,8 +52,8 @@ def ensure_campaign_exists(form_doc):
         frappe.logger().error(f"Error ensuring campaign exists for form_id {form_doc.form_id}: {str(e)}")
         return None
 
-def ensure_ads_exists(form_doc, doc, ads_id=None):
-    """Ensure an ads exists for the given Meta Lead Form."""
+def ensure_ads_exists(form_doc, doc, ads_id=None, commit=True):
+    """Ensure an ads exists for the given Meta Lead Form. Pass `commit=False` to leave the commit to the caller."""
     try:
         current_date = datetime.now().strftime("%d%m%Y")
         # Generate Ads ID and Name
@@ -68,7 +73,7 @@ def ensure_ads_exists(form_doc, doc, ads_id=None):
             #     existing_ads_doc.db_set("campaign", form_doc.campaign)
             # elif not existing_ads_doc.campaign and not form_doc.campaign:
             if not existing_ads_doc.campaign:
-                campaign_id = ensure_campaign_exists(form_doc)
+                campaign_id = ensure_campaign_exists(form_doc, commit=commit)
                 if not campaign_id:
                     frappe.throw(f"Could not create or find a campaign for form_id: {form_doc.form_id}")
                 # 1a. remove form_doc.camapgin under form M:M campaign deps.
@@ -80,7 +85,7 @@ def ensure_ads_exists(form_doc, doc, ads_id=None):
         # If the campaign is missing, create it first
         # TODO: 1a. remove form_doc.campaign condition, directly make sure that campaign exists and assign it to ads.
         # if not form_doc.campaign:
-        campaign_id = ensure_campaign_exists(form_doc)
+        campaign_id = ensure_campaign_exists(form_doc, commit=commit)
         doc.db_set("campaign", campaign_id)
         # if campaign_id:
         #     form_doc.db_set("campaign", campaign_id)
@@ -100,7 +105,8 @@ def ensure_ads_exists(form_doc, doc, ads_id=None):
         })
 
         new_ads.insert(ignore_permissions=True)
-        frappe.db.commit()
+        if commit:
+            frappe.db.commit()
 
         return new_ads.name  # Return new Ads ID
 
@@ -129,14 +135,35 @@ def _process_lead_logs_in_bulk(docnames):
     """
     Actual worker function that processes each docname in the background.
     """
+    docs = []
     for docname in docnames:
         try:
-            doc = frappe.get_doc("Meta Webhook Lead Logs", docname)
-            # Re-run your manual retry function or call the logic directly
-            manual_retry_lead_processing(docname)
+            docs.append(frappe.get_doc("Meta Webhook Lead Logs", docname))
         except Exception as e:
             frappe.logger().error(f"Bulk job error for doc {docname}: {str(e)}", exc_info=True)
 
+    # Fetch missing lead details up front in Graph batches, instead of one call per lead
+    try:
+        prefetch_lead_payloads([doc for doc in docs if doc.processing_status not in ["Processed", "Pending"]])
+    except Exception as e:
+        frappe.logger().error(f"Bulk job error while fetching lead details: {str(e)}", exc_info=True)
+
+    from .lead_batch import process_lead_logs_in_batches
+
+    docs_to_process = []
+    for doc in docs:
+        if doc.processing_status in ["Processed", "Pending"]:
+            continue
+        try:
+            if doc.processing_status in ["Unconfigured", "Disabled"] or not doc.config_reference or not doc.lead_doctype:
+                reconfigure_lead_log(doc)
+            docs_to_process.append(doc)
+        except Exception as e:
+            frappe.logger().error(f"Bulk job error for doc {doc.name}: {str(e)}", exc_info=True)
+
+    # Create the leads in chunks, one commit per chunk instead of one per lead
+    process_lead_logs_in_batches(docs_to_process)
+
 @frappe.whitelist()
 def manual_retry_lead_processing(docname=None, doc=None):
     """Manually retry processing a lead log entry."""
@@ -172,7 +199,7 @@ def reconfigure_lead_log(doc):
     """
     try:
         # Re-fetch global config (to check if page_flow is enabled, or to locate correct doctype)
-        global_conf = frappe.get_single("Meta Webhook Config")
+        global_conf = frappe.get_cached_doc("Meta Webhook Config")
 
         # 1. Check if the form exists in "Meta Lead Form"
         configured_form = frappe.db.exists("Meta Lead Form", {"form_id": doc.form_id})
@@ -227,60 +254,153 @@ def reconfigure_lead_log(doc):
             "error_message": f"Error in reconfigure_lead_log: {str(e)}"
         })
 
+# ================== Lead Ingest ==================
+
+# Dedicated worker queue for lead processing, add it under `workers` in common_site_config.json
+LEAD_INGEST_QUEUE = "onelead"
+
+def get_ingest_queue():
+    """Return the queue lead jobs go to, falling back to `default` if `onelead` is not configured."""
+    return LEAD_INGEST_QUEUE if LEAD_INGEST_QUEUE in get_queues_timeout() else "default"
+
+def handle_logged_lead(doc, method):
+    """
+    `after_insert` hook of Meta Webhook Lead Logs.
+    In async ingest mode the lead is only queued here, so the webhook can be acknowledged
+    without waiting on the Graph API, otherwise it's processed in the same request.
+    """
+    if frappe.get_cached_doc("Meta Webhook Config").async_ingest:
+        enqueue_logged_lead(doc.name)
+    else:
+        process_logged_lead(doc, method)
+
+def dispatch_logged_leads(log_names):
+    """Same as `handle_logged_lead`, for logs inserted in bulk without running doc hooks."""
+    if frappe.get_cached_doc("Meta Webhook Config").async_ingest:
+        for log_name in log_names:
+            enqueue_logged_lead(log_name)
+        return
+
+    for log_name in log_names:
+        process_logged_lead(frappe.get_doc("Meta Webhook Lead Logs", log_name), "after_insert")
+
+def enqueue_logged_lead(log_name):
+    """Queue a logged lead for processing once the current transaction is committed."""
+    frappe.enqueue(
+        "onelead.utils.meta.manage_leads.process_queued_lead",
+        log_name=log_name,
+        queue=get_ingest_queue(),
+        job_id=f"onelead_lead_{log_name}",
+        deduplicate=True,
+        enqueue_after_commit=True
+    )
+
+def process_queued_lead(log_name):
+    """Worker side of async ingest, records the queue lag and processes the lead."""
+    doc = frappe.get_doc("Meta Webhook Lead Logs", log_name)
+    if doc.processing_status == "Processed":
+        return
+
+    if doc.received_time:
+        queue_lag = time_diff_in_seconds(now_datetime(), doc.received_time)
+        doc.db_set("queue_lag", queue_lag, update_modified=False)
+        frappe.logger().info(f"Lead log {log_name} picked up after {queue_lag:.2f}s in queue")
+
+    process_logged_lead(doc, "queue")
+
+@frappe.whitelist()
+def get_ingest_queue_status():
+    """Report how far the lead ingest queue is behind."""
+    frappe.has_permission("Meta Webhook Lead Logs", "read", throw=True)
+
+    queue_name = get_ingest_queue()
+    pending = frappe.get_all(
+        "Meta Webhook Lead Logs",
+        filters={"processing_status": "Pending"},
+        fields=["count(name) as count", "min(received_time) as oldest"]
+    )[0]
+
+    oldest_pending_lag = time_diff_in_seconds(now_datetime(), pending.oldest) if pending.oldest else 0
+    avg_queue_lag = frappe.db.sql("""
+        SELECT AVG(queue_lag) FROM `tabMeta Webhook Lead Logs`
+        WHERE received_time >= %s AND queue_lag > 0
+    """, (frappe.utils.add_to_date(now_datetime(), hours=-1),))[0][0]
+
+    return {
+        "async_ingest": frappe.db.get_single_value("Meta Webhook Config", "async_ingest"),
+        "queue": queue_name,
+        "queued_jobs": get_queue(queue_name).count,
+        "pending_logs": pending.count,
+        "oldest_pending_lag": oldest_pending_lag,
+        "avg_queue_lag_last_hour": round(avg_queue_lag or 0, 2)
+    }
+
+
 def process_logged_lead(doc, method):
-  """Process a lead after it's logged in Meta Webhook Lead Logs."""
-  try:
-      meta_config = frappe.get_single("Meta Webhook Config")
+    """Process a lead after it's logged in Meta Webhook Lead Logs."""
+    try:
+        meta_config = frappe.get_cached_doc("Meta Webhook Config")
 
+        prepared = prepare_logged_lead(doc, meta_config)
+        if prepared:
+            # Map and create lead Entry
+            lead_data, form_config = prepared
+            lead_doc = create_lead_entry(lead_data, form_config, doc, meta_config.lead_creator)
+            mark_lead_processed(doc, lead_doc)
+
+        if method == "manual":
+            return {"status": "success", "message": "Lead processed successfully"}
+
+    except Exception as e:
+        mark_lead_error(doc, str(e))
+        frappe.logger().error(f"Error in processing lead for leadgen_id {doc.leadgen_id}: {str(e)}", exc_info=True)
+        if method == "manual":
+            return {"status": "error", "message": str(e)}
+
+
+def prepare_logged_lead(doc, meta_config, commit=True):
+    """
+    Fetch the lead details and check a logged lead can be turned into a lead.
+
+    Campaign and Ads are created on the way when missing. When the lead can't be created
+    the log status is updated and None is returned.
+
+    Returns:
+        tuple: (lead_data, form_config) of a lead ready to be created, else None.
+    """
     #   FETCH LEAD DATA FROM META API
-      lead_data = None
-      if not doc.lead_payload:
+    lead_data = None
+    if not doc.lead_payload:
         # Use Meta SDK to fetch lead data
         lead_data = fetch_lead_from_meta(doc.leadgen_id, meta_config)
         if lead_data:
-          # Log the data first
-          doc.db_set({
-              "lead_payload": json.dumps(lead_data),
-              "organic": lead_data.get("is_organic", False),
-              "platform": 'Instagram' if lead_data.get("platform") == 'ig' else 'Facebook' if lead_data.get("platform") == 'fb' else '',
-          })
-      else:
-        lead_data = json.loads(doc.lead_payload)
-
-      
-      # Retrieve the form configuration for the given form_id
-      form_config = frappe.get_doc("Meta Lead Form", {"form_id": doc.form_id})
-
-      # If form configuration is not found, update log status and exit - already configured. just setting up error.
-      # TODO: 1b. remove this condition, as it's already handled in reconfigure_lead_log, and create_lead_log.
-    #   if not form_config:
-    #       doc.db_set("processing_status", "Unconfigured")
-    #       doc.db_set("error_message", f"No form found in `Meta Lead Form` for form_id: {doc.form_id}, please fetch forms again to get the latest forms.")
-    #       return
-      if not doc.campaign and doc.ad_id:
-        campaign_id = ensure_campaign_exists(form_config)
+            # Log the data first
+            store_lead_payload(doc, lead_data)
+    else:
+        lead_data = decode_payload(doc.lead_payload)
+
+    # Retrieve the form configuration for the given form_id
+    form_config = frappe.get_doc("Meta Lead Form", {"form_id": doc.form_id})
+
+    if not doc.campaign and doc.ad_id:
+        campaign_id = ensure_campaign_exists(form_config, commit=commit)
         if campaign_id:
             doc.db_set("campaign", campaign_id)
 
-      # Ensure ads exists and update doc.ads if necessary
-      if not doc.ads and doc.ad_id:
-        ads_id = ensure_ads_exists(form_config, doc, doc.ad_id)
+    # Ensure ads exists and update doc.ads if necessary
+    if not doc.ads and doc.ad_id:
+        ads_id = ensure_ads_exists(form_config, doc, doc.ad_id, commit=commit)
         if ads_id:
-            #   1a. remove form_config.campaign for M:M relationship
-            # form_config.db_set("ads", ads_id)
             doc.db_set("ads", ads_id)
-    #   if not doc.camapign:
-          
-      
-      if meta_config.page_flow:
+
+    if meta_config.page_flow:
         if doc.config_not_enabled:
-          doc.db_set({
+            doc.db_set({
                 "processing_status": "Disabled",
                 "error_message": f"Configuration can be found, but {doc.config_reference} is not Enabled"
-          })
-          return
+            })
+            return
 
-        # TODO: 1b. remove this condition, as it's already handled in reconfigure_lead_log, and create_lead_log.
         # Rquired last check, if form_config is not found, then exit.
         if not doc.config_reference:
             doc.db_set({
@@ -288,7 +408,7 @@ def process_logged_lead(doc, method):
                 "error_message": f"Configuration is not mapped properly, please make sure that form with form_id {doc.form_id} is mapped to a config of page {doc.page_id}"
             })
             return
-        
+
         # This is required for adding Lead link to the log doc. so checks to make sure it exists.
         if not form_config.lead_doctype_reference:
             doc.db_set({
@@ -302,63 +422,58 @@ def process_logged_lead(doc, method):
                 "error_message": "Ads and Campaign is not set in log doc"
             })
             return
-        # else:
-        #     try:
-        #         ads_doc = frappe.get_doc("Meta Ads", doc.ad_id)
-        #         form_config.db_set("campaign", ads_doc.campaign)
-        #         doc.db_set("campaign", ads_doc.campaign)
-        #     except Exception as e:
-        #         frappe.logger().error(f"Error in setting campaign for leadgen_id {doc.leadgen_id}")
-        #         doc.db_set("processing_status", "Disabled")
-        #         doc.db_set("error_message", f"Error in setting campaign for leadgen_id {doc.leadgen_id}")
-        #         return
-
-      if lead_data:
-          # Map and create lead Entry
-          user = meta_config.lead_creator
-          lead_doc = create_lead_entry(lead_data, form_config, doc, user)
-          doc.db_set({
-                "processing_status": "Processed",
-                "lead_doc_reference": lead_doc.name,
-                "error_message": ""
-          })
-      else:
-          doc.db_set({
-                "processing_status": "Error",
-                "error_message": "Failed to retrieve lead details from Meta API"
-          })
-
-      if method == "manual":
-          return {"status": "success", "message": "Lead processed successfully"}
-
-  except Exception as e:
-      doc.db_set({
-            "processing_status": "Error",
-            "error_message": str(e)
-      })
-      frappe.logger().error(f"Error in processing lead for leadgen_id {doc.leadgen_id}: {str(e)}", exc_info=True)
-      if method == "manual":
-          return {"status": "error", "message": str(e)}
-    
+
+    if not lead_data:
+        mark_lead_error(doc, "Failed to retrieve lead details from Meta API")
+        return
+
+    return lead_data, form_config
+
+
+def mark_lead_processed(doc, lead_doc):
+    doc.db_set({
+        "processing_status": "Processed",
+        "lead_doc_reference": lead_doc.name,
+        "error_message": ""
+    })
 
 
+def mark_lead_error(doc, error_message):
+    doc.db_set({
+        "processing_status": "Error",
+        "error_message": error_message
+    })
+
+
+def store_lead_payload(doc, lead_data):
+    """Save the lead details fetched from Meta on its log."""
+    doc.db_set(get_lead_payload_values(lead_data))
+
+LEAD_FIELDS = ["ad_id", "campaign_id", "field_data", "form_id", "created_time", "is_organic", "platform", "post", "vehicle"]
+
+# Graph API accepts at most 50 requests in a batch
+GRAPH_BATCH_SIZE = 50
+
+# Times requests Meta left unanswered in a batch are sent again
+GRAPH_BATCH_RETRIES = 2
+
 def fetch_lead_from_meta(leadgen_id, meta_config):
     """Fetch lead details from Meta using facebook_business SDK."""
     try:
         # Initialize SDK client with access token and App
-        # meta_config = frappe.get_single("Meta Webhook Config")
-        app_id = meta_config.app_id
-        app_secret = meta_config.get_password("app_secret")
-        user_token = meta_config.get_password("user_access_token")
+        credentials = get_meta_credentials()
+        app_id = credentials.app_id
+        app_secret = credentials.app_secret
+        user_token = credentials.user_access_token
 
         # Check if all fields has data.
         if not app_id or not app_secret or not user_token:
             frappe.throw("App ID, App Secret, and User Token must all be provided in Meta Webhook Config.")
         
         # Initialize the Facebook API
-        FacebookAdsApi.init(app_id, app_secret, user_token)
+        api = get_graph_api(user_token, app_id, app_secret)
 
-        lead = Lead(leadgen_id).api_get(fields=["ad_id", "campaign_id", "field_data", "form_id", "created_time", "is_organic", "platform", "post", "vehicle"])
+        lead = Lead(leadgen_id, api=api).api_get(fields=LEAD_FIELDS)
 
         # convert lead to dictionary/ json
         lead = lead.export_all_data()
@@ -369,105 +484,149 @@ def fetch_lead_from_meta(leadgen_id, meta_config):
         frappe.logger().error(f"Error fetching lead data from Meta for leadgen_id {leadgen_id}: {str(e)}", exc_info=True)
         raise e
     
-def process_default_value(default_value, log_doc, form_doc):
+def fetch_leads_in_batch_from_meta(leadgen_ids):
+    """
+    Fetch lead details of many leads using Graph API batch requests, 50 leads per call.
+
+    Returns:
+        dict: {leadgen_id: lead data}, leads that failed to fetch are logged and left out.
+    """
+    credentials = get_meta_credentials()
+    if not credentials.app_id or not credentials.app_secret or not credentials.user_access_token:
+        frappe.throw("App ID, App Secret, and User Token must all be provided in Meta Webhook Config.")
+
+    api = get_graph_api(credentials.user_access_token, credentials.app_id, credentials.app_secret)
+
+    leads = {}
+    failed = set()
+    def on_success(leadgen_id, response):
+        leads[leadgen_id] = response.json()
+
+    def on_failure(leadgen_id, response):
+        failed.add(leadgen_id)
+        frappe.logger().error(f"Error fetching lead data from Meta for leadgen_id {leadgen_id}: {response.error()}")
+
+    for start in range(0, len(leadgen_ids), GRAPH_BATCH_SIZE):
+        batch = api.new_batch()
+        for leadgen_id in leadgen_ids[start:start + GRAPH_BATCH_SIZE]:
+            Lead(leadgen_id, api=api).api_get(
+                fields=LEAD_FIELDS,
+                batch=batch,
+                success=partial(on_success, leadgen_id),
+                failure=partial(on_failure, leadgen_id)
+            )
+
+        # execute() returns a batch of the requests Meta answered with null (timeouts), retried a few times
+        for _ in range(GRAPH_BATCH_RETRIES + 1):
+            batch = batch.execute()
+            if not batch:
+                break
+
+    missing = [leadgen_id for leadgen_id in leadgen_ids if leadgen_id not in leads and leadgen_id not in failed]
+    if missing:
+        frappe.logger().warning(f"No lead data from the Meta batch for leadgen_ids {', '.join(missing)}, fetched one by one later")
+    return leads
+
+def prefetch_lead_payloads(docs):
+    """Fetch and store the lead details of all logs that don't have them yet, in Graph batches."""
+    docs_to_fetch = {doc.leadgen_id: doc for doc in docs if not doc.lead_payload}
+    if not docs_to_fetch:
+        return
+
+    leads = fetch_leads_in_batch_from_meta(list(docs_to_fetch))
+    for leadgen_id, lead_data in leads.items():
+        store_lead_payload(docs_to_fetch[leadgen_id], lead_data)
+
+class DefaultValueContext:
+    """
+    Resolves `field:` default values for one lead. The field is looked up in the log,
+    then the Meta Lead Form, then the ads config doc, which is loaded at most once per lead.
+    """
 
-    # fetch ads_config doc if default_value is pased as dynamic field value. 
-    ads_config_doc = frappe.get_doc(log_doc.config_doctype_name, log_doc.config_reference)
+    def __init__(self, log_doc, form_doc):
+        self.log_doc = log_doc
+        self.form_doc = form_doc
+        self._config_doc = None
+        self._values = {}
 
-    # Check if default_value is referencing a field in the config doctype
-    if isinstance(default_value, str) and default_value.startswith("field:"):
-        # Extract the field name after "field:" prefix
-        default_field_name = default_value.split("field:")[1].strip()
-        
+    @property
+    def config_doc(self):
+        if self._config_doc is None:
+            self._config_doc = frappe.get_doc(self.log_doc.config_doctype_name, self.log_doc.config_reference)
+        return self._config_doc
+
+    def resolve(self, default_field_name, default_value):
+        if default_field_name not in self._values:
+            self._values[default_field_name] = self._lookup(default_field_name)
+
+        field_value = self._values[default_field_name]
+        return default_value if field_value is None else field_value
+
+    def _lookup(self, default_field_name):
         # Retrieve the field value from any of the below documents
         # Priority order: log_doc → form_doc → ads_config_doc
-        for source in (log_doc, form_doc, ads_config_doc):
-            if hasattr(source, default_field_name):
-                field_value = getattr(source, default_field_name)
-
-                # If the field exists but is None or empty, continue checking the next source
-                if field_value not in [None, ""]:
-                    return field_value
-    
-        # If not found in any document, log a warning and return the original default_value
+        for source in (self.log_doc, self.form_doc):
+            field_value = getattr(source, default_field_name, None)
+            # If the field exists but is None or empty, continue checking the next source
+            if field_value not in [None, ""]:
+                return field_value
+
+        if self.log_doc.config_reference:
+            field_value = getattr(self.config_doc, default_field_name, None)
+            if field_value not in [None, ""]:
+                return field_value
+
+        # If not found in any document, log a warning and keep the original default_value
         frappe.logger().warning(
-            f"Field '{default_field_name}' not found or is empty in {log_doc.config_doctype_name}, Meta Lead Form, and Ads Config."
+            f"Field '{default_field_name}' not found or is empty in {self.log_doc.config_doctype_name}, Meta Lead Form, and Ads Config."
         )
-    return default_value
+        return None
 
-def create_lead_entry(lead_data, form_doc, log_doc, user="Administrator"):
+def create_lead_entry(lead_data, form_doc, log_doc, user="Administrator", commit=True):
     """Create a new Lead record in Frappe based on Meta lead data and form configuration."""
     try:
-        field_data = lead_data.get("field_data", [])
-        meta_lead_info = {field["name"]: field["values"][0] for field in field_data if "values" in field}
-        
-        new_lead = frappe.new_doc(form_doc.lead_doctype_reference)
-
-        # Map the fields according to form configuration
-        for mapping in form_doc.mapping:
-            meta_field = mapping.meta_field
-            lead_field = mapping.lead_doctype_field
-            default_value = mapping.default_value
-                
-            # Use the default value if no data is provided from Meta
-            field_value = meta_lead_info.get(meta_field, None)
-            if not field_value:
-                field_value = process_default_value(default_value, log_doc, form_doc)
-
-            # If a custom formatting function is specified, apply it
-            if mapping.formatting_function:
-                try:
-                    # Split by comma to get function name and arguments
-                    func_name = mapping.formatting_function
-                    func_params = parse_function_parameters(mapping.function_parameters)
-                    # func_params = mapping.function_parameters.split(',') if mapping.function_parameters else []
-                    # func_name, *args = [arg.strip() for arg in mapping.formatting_function.split(',')]
-                    # formatting_func = getattr(formatting_functions, func_name, None)
-                    
-                    # Call the function with field_value and additional arguments
-                    # if formatting_func:
-                    #     field_value = formatting_func(field_value, *args)
-
-                    if func_name in FORMATTING_FUNCTIONS:
-                        formatting_func = FORMATTING_FUNCTIONS[func_name]
-                        field_value = formatting_func(field_value, *func_params)
-                except Exception as e:
-                    frappe.logger().error(f"Error in formatting function '{mapping.formatting_function}' for {lead_field}: {str(e)}")
-
-
-            new_lead.set(lead_field, field_value)
+        new_lead = build_lead_doc(lead_data, form_doc, log_doc)
 
         # Insert the new lead and commit to database
         frappe.set_user(user)
-        res = new_lead.insert(ignore_permissions=True)
-        frappe.db.commit()
-        
+        new_lead.insert(ignore_permissions=True)
+        if commit:
+            frappe.db.commit()
+
         frappe.logger().info(f"Lead created successfully with name: {new_lead.name}")
         return new_lead
 
     except Exception as e:
         frappe.logger().error(f"Error creating lead document: {str(e)}", exc_info=True)
         raise
-    
 
-def parse_function_parameters(param_string):
-    if not param_string:
-        return []
 
-    param_string = param_string.strip()
+def build_lead_doc(lead_data, form_doc, log_doc):
+    """Map Meta lead data to a new, unsaved lead document of the form's lead doctype."""
+    field_data = lead_data.get("field_data", [])
+    meta_lead_info = {field["name"]: field["values"][0] for field in field_data if "values" in field}
+    
+    plan = get_mapping_plan(form_doc)
+    new_lead = frappe.new_doc(plan.lead_doctype)
+    defaults = DefaultValueContext(log_doc, form_doc)
+
+    # Map the fields according to the compiled form configuration
+    for step in plan.steps:
+        # Use the default value if no data is provided from Meta
+        field_value = meta_lead_info.get(step.meta_field, None)
+        if not field_value:
+            field_value = defaults.resolve(step.default_field, step.default_value) if step.default_field else step.default_value
+
+        # If a custom formatting function is specified, apply it
+        if step.formatter:
+            try:
+                field_value = step.formatter(field_value, *step.args, **step.kwargs)
+            except Exception as e:
+                frappe.logger().error(f"Error in formatting function '{step.formatter.__name__}' for {step.lead_field}: {str(e)}")
 
-    # Try JSON parsing first (for both objects & lists)
-    try:
-        parsed_data = json.loads(param_string)
-        if isinstance(parsed_data, dict):  # JSON Object (Key-Value)
-            return parsed_data
-        elif isinstance(parsed_data, list):  # JSON List (Array)
-            return parsed_data
-    except json.JSONDecodeError:
-        pass  # Not JSON, proceed with comma-separated parsing
+        new_lead.set(step.lead_field, field_value)
 
-    # Fallback: Comma-Separated String
-    return [param.strip() for param in param_string.split(',') if param.strip()]
+    return new_lead
 
 
 # Example setup for calling the function dynamically
@@ -485,73 +644,3 @@ def parse_function_parameters(param_string):
 #     else:
 #         # Function expects more than two arguments
 #         return func(value, *args[:func_param_count - 1])
-
-
-
-import frappe
-from frappe.utils import now_datetime
-
-def poll_leads():
-    """Polling job to fetch leads from Meta Ads API"""
-    
-    config = frappe.get_single("Meta Webhook Config")
-    if not config.enable_polling:
-        return  # Exit if polling is disabled
-    
-    job_log = frappe.new_doc("Polling Summary Log")
-    job_log.job_start_time = now_datetime()
-    job_log.polling_interval_used = config.polling_interval
-
-    total_leads = 0
-    new_leads = 0
-    duplicates = 0
-    failed = 0
-    error_messages = []
-
-    try:
-        # Fetch only new leads (after last polling time)
-        last_poll_time = config.last_polling_time or "1970-01-01 00:00:00"
-        leads = fetch_leads_from_meta(last_poll_time)
-        
-        total_leads = len(leads)
-        
-        for lead in leads:
-            leadgen_id = lead.get("leadgen_id")
-            
-            if frappe.db.exists("Meta Webhook Lead Logs", {"leadgen_id": leadgen_id}):
-                duplicates += 1
-                continue  # Skip if duplicate
-            
-            try:
-                log_entry = frappe.new_doc("Meta Webhook Lead Logs")
-                log_entry.update({
-                    "leadgen_id": leadgen_id,
-                    "raw_payload": json.dumps(lead),
-                    "received_time": now_datetime(),
-                    "source": "Polling",
-                    "polling_summary_reference": job_log.name
-                })
-                log_entry.insert(ignore_permissions=True)
-                new_leads += 1
-            except Exception as e:
-                failed += 1
-                error_messages.append(str(e))
-        
-        job_log.new_leads_created = new_leads
-        job_log.duplicate_leads = duplicates
-        job_log.failed_leads = failed
-        job_log.total_leads_fetched = total_leads
-        job_log.error_messages = "\n".join(error_messages)
-        job_log.job_end_time = now_datetime()
-        
-        job_log.insert(ignore_permissions=True)
-        frappe.db.commit()
-
-        # Update last polling time
-        config.db_set("last_polling_time", now_datetime())
-        
-    except Exception as e:
-        job_log.error_messages = f"Polling failed: {str(e)}"
-        job_log.insert(ignore_permissions=True)
-        frappe.db.commit()
-        frappe.logger().error(f"Error in polling job: {str(e)}", exc_info=True)
@@ -0,0 +1,112 @@
+import frappe
+import json
+from collections import namedtuple
+from types import MappingProxyType
+from ..formatting_functions import FORMATTING_FUNCTIONS
+
+# One mapping row of a Meta Lead Form, with its formatting function resolved and parameters parsed.
+# `default_field` is set for `field:` defaults that can only be resolved per lead.
+MappingStep = namedtuple("MappingStep", ["meta_field", "lead_field", "default_value", "default_field", "formatter", "args", "kwargs"])
+
+# Compiled mapping of a Meta Lead Form, `steps` is a tuple of MappingStep
+MappingPlan = namedtuple("MappingPlan", ["form", "modified", "lead_doctype", "steps"])
+
+# {(site, form name): MappingPlan}, kept per worker process
+_mapping_plans = {}
+
+
+def get_mapping_plan(form_doc):
+    """
+    Return the compiled mapping plan of a Meta Lead Form.
+    Plans are compiled once per form and recompiled when the form's `modified` changes.
+    """
+    key = (frappe.local.site, form_doc.name)
+    plan = _mapping_plans.get(key)
+    if plan and plan.modified == str(form_doc.modified):
+        return plan
+
+    plan = compile_mapping_plan(form_doc)
+    _mapping_plans[key] = plan
+    return plan
+
+
+def compile_mapping_plan(form_doc):
+    """Compile the `mapping` rows of a Meta Lead Form into an immutable MappingPlan."""
+    steps = []
+    log_columns = set(frappe.get_meta("Meta Webhook Lead Logs").get_valid_columns())
+    for mapping in form_doc.mapping:
+        if not mapping.lead_doctype_field:
+            continue
+
+        default_value, default_field = compile_default_value(mapping.default_value, form_doc, log_columns)
+
+        formatter = None
+        args, kwargs = (), {}
+        if mapping.formatting_function:
+            formatter = FORMATTING_FUNCTIONS.get(mapping.formatting_function)
+            if not formatter:
+                frappe.logger().warning(
+                    f"Formatting function '{mapping.formatting_function}' of {mapping.lead_doctype_field} in Meta Lead Form {form_doc.name} is not registered"
+                )
+            params = parse_function_parameters(mapping.function_parameters)
+            if isinstance(params, dict):
+                kwargs = params
+            else:
+                args = tuple(params)
+
+        steps.append(MappingStep(
+            meta_field=mapping.meta_field,
+            lead_field=mapping.lead_doctype_field,
+            default_value=default_value,
+            default_field=default_field,
+            formatter=formatter,
+            args=args,
+            kwargs=MappingProxyType(kwargs)
+        ))
+
+    return MappingPlan(
+        form=form_doc.name,
+        modified=str(form_doc.modified),
+        lead_doctype=form_doc.lead_doctype_reference,
+        steps=tuple(steps)
+    )
+
+
+def compile_default_value(default_value, form_doc, log_columns):
+    """
+    Split a default value into (value, field to resolve per lead).
+
+    `field:<fieldname>` defaults are looked up in the lead log, then the form, then the ads config.
+    When the log has no such field and the form has a value, the form's value always wins,
+    so it's resolved here once instead of for every lead.
+    """
+    if not (isinstance(default_value, str) and default_value.startswith("field:")):
+        return default_value, None
+
+    default_field_name = default_value.split("field:")[1].strip()
+    if default_field_name not in log_columns:
+        form_value = getattr(form_doc, default_field_name, None)
+        if form_value not in [None, ""]:
+            return form_value, None
+
+    return default_value, default_field_name
+
+
+def parse_function_parameters(param_string):
+    if not param_string:
+        return []
+
+    param_string = param_string.strip()
+
+    # Try JSON parsing first (for both objects & lists)
+    try:
+        parsed_data = json.loads(param_string)
+        if isinstance(parsed_data, dict):  # JSON Object (Key-Value)
+            return parsed_data
+        elif isinstance(parsed_data, list):  # JSON List (Array)
+            return parsed_data
+    except json.JSONDecodeError:
+        pass  # Not JSON, proceed with comma-separated parsing
+
+    # Fallback: Comma-Separated String
+    return [param.strip() for param in param_string.split(',') if param.strip()]
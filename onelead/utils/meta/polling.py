@@ -0,0 +1,133 @@
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import frappe
+from frappe.utils import add_to_date, get_datetime, now_datetime, time_diff_in_hours
+
+from .backfill import store_fetched_leads
+from .credentials import get_page_access_token
+from .graph_client import graph_get
+from .manage_leads import LEAD_FIELDS
+
+POLLING_QUEUE = "long"
+
+# Forms fetched in parallel, the threads only make Graph API calls
+POLLING_WORKERS = 5
+
+# Leads requested per Graph API page
+POLLING_PAGE_SIZE = 100
+
+
+def poll_leads():
+    """
+    Hourly. Queue a poll once `polling_interval` hours went by since the last one.
+    Polling picks up leads the webhook missed, e.g. while the site was down.
+    """
+    config = frappe.get_cached_doc("Meta Webhook Config")
+    if not config.enable_polling:
+        return  # Exit if polling is disabled
+
+    if config.last_polling_time and time_diff_in_hours(now_datetime(), config.last_polling_time) < (config.polling_interval or 1):
+        return
+
+    frappe.enqueue(
+        "onelead.utils.meta.polling.run_lead_polling",
+        queue=POLLING_QUEUE,
+        job_id="onelead_lead_polling",
+        deduplicate=True
+    )
+
+
+def run_lead_polling():
+    """
+    Fetch the leads created after each form's watermark, forms are fetched in parallel.
+    Logging and lead creation stay on this thread, as they use the database.
+    """
+    config = frappe.get_cached_doc("Meta Webhook Config")
+    polling_started = now_datetime()
+
+    forms = frappe.get_all(
+        "Meta Lead Form",
+        filters={"page": ["is", "set"], "status": ["!=", "ARCHIVED"]},
+        fields=["name", "form_id", "page", "polling_watermark"]
+    )
+
+    # Leads of forms never polled are fetched from one interval back, older ones are for the backfill
+    default_watermark = int(add_to_date(polling_started, hours=-(config.polling_interval or 1)).timestamp())
+    if config.last_polling_time:
+        default_watermark = int(get_datetime(config.last_polling_time).timestamp())
+
+    polls = []
+    for form in forms:
+        access_token = get_page_access_token(form.page)
+        if not access_token:
+            frappe.logger().warning(f"Skipping polling of Meta Lead Form {form.name}: no page access token for page {form.page}")
+            continue
+        polls.append((form, access_token, form.polling_watermark or default_watermark))
+
+    new_leads = 0
+    with ThreadPoolExecutor(max_workers=POLLING_WORKERS) as executor:
+        futures = {
+            executor.submit(
+                fetch_leads_since, frappe.local.site, frappe.local.sites_path,
+                config.meta_url, config.meta_api_version, form.form_id, access_token, watermark
+            ): form
+            for form, access_token, watermark in polls
+        }
+        for future in as_completed(futures):
+            form = futures[future]
+            try:
+                new_leads += store_polled_leads(form, future.result(), config)
+            except Exception as e:
+                frappe.db.rollback()
+                frappe.logger().error(f"Error in polling leads of Meta Lead Form {form.name}: {str(e)}", exc_info=True)
+
+    frappe.db.set_single_value("Meta Webhook Config", "last_polling_time", polling_started)
+    frappe.db.commit()
+    frappe.logger().info(f"Polled {len(polls)} forms, {new_leads} new leads")
+
+
+def fetch_leads_since(site, sites_path, meta_url, api_version, form_id, access_token, watermark):
+    """
+    Return all leads of a form created at or after `watermark` (epoch).
+    Runs in a pool thread, the site is set up for the shared Graph rate limit only, without a database connection.
+    """
+    frappe.init(site=site, sites_path=sites_path)
+    try:
+        return fetch_form_leads(meta_url, api_version, form_id, access_token, watermark)
+    finally:
+        frappe.destroy()
+
+
+def fetch_form_leads(meta_url, api_version, form_id, access_token, watermark):
+    url = f"{meta_url}/{api_version}/{form_id}/leads"
+    params = {
+        "access_token": access_token,
+        "fields": ",".join(["id", *LEAD_FIELDS]),
+        "limit": POLLING_PAGE_SIZE,
+        # Leads of the watermark's own second may not have been returned yet, the repeats are deduplicated on logging
+        "filtering": json.dumps([{"field": "time_created", "operator": "GREATER_THAN_OR_EQUAL", "value": watermark}])
+    }
+
+    leads = []
+    while url:
+        response = graph_get(url, params=params)
+        if "error" in response:
+            raise Exception(response["error"].get("message", "Graph API error"))
+
+        leads.extend(response.get("data", []))
+        # The `next` url carries all the params
+        url, params = response.get("paging", {}).get("next"), None
+    return leads
+
+
+def store_polled_leads(form, leads, config):
+    """Log the polled leads of a form and move its watermark to the newest one."""
+    if not leads:
+        return 0
+
+    new_leads = store_fetched_leads(leads, form, config, source="Polling")
+    watermark = max(int(get_datetime(lead["created_time"]).timestamp()) for lead in leads)
+    frappe.db.set_value("Meta Lead Form", form.name, "polling_watermark", watermark, update_modified=False)
+    frappe.db.commit()
+    return new_leads
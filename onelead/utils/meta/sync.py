@@ -0,0 +1,243 @@
+import json
+
+import frappe
+from frappe.utils import add_to_date, now_datetime
+
+from .manage_ads import create_meta_ads_page_config_doc, fetch_campaigns, fetch_forms_based_on_page, sync_ad_account
+
+SYNC_QUEUE = "long"
+
+# Sync jobs running at the same time on the site, across all workers
+SYNC_CONCURRENCY = 4
+
+# Site-wide counter of the running sync jobs
+SYNC_RUNNING_KEY = "onelead:sync:running"
+
+SYNC_START_LOCK = "onelead:sync:start"
+
+# Run state kept in Redis, long enough for the slowest sync
+SYNC_STATE_TTL = 24 * 60 * 60
+
+# A run without a finished task for this long lost its jobs, e.g. to a killed worker, in seconds
+SYNC_STALE_AFTER = 3 * 60 * 60
+
+
+def start_sync_run(ad_accounts):
+    """
+    Start a Meta Sync Run syncing each ad account in its own job.
+    In page flow an account job queues one job per page of the account for its forms.
+    Throws while another run is active, only one run syncs at a time.
+    """
+    lock = frappe.cache.lock(frappe.cache.make_key(SYNC_START_LOCK), timeout=60, blocking_timeout=0)
+    if not lock.acquire():
+        frappe.throw("A Meta sync is being started, please wait for it to finish.")
+
+    try:
+        ensure_no_active_sync_run()
+        run = frappe.get_doc({
+            "doctype": "Meta Sync Run",
+            "status": "Running",
+            "started_at": now_datetime()
+        })
+        run.insert(ignore_permissions=True)
+        # Committed under the lock, so a concurrent start sees the run
+        frappe.db.commit()
+    finally:
+        lock.release()
+
+    if not ad_accounts:
+        finish_sync_run(run.name)
+        frappe.db.commit()
+        return run.name
+
+    add_sync_tasks(run.name, [{"type": "account", "account": ad_account} for ad_account in ad_accounts])
+    # Jobs must see the run, so commit before they are queued
+    frappe.db.commit()
+    fill_sync_slots(run.name)
+    return run.name
+
+
+def get_active_sync_run():
+    """Name of the Queued or Running Meta Sync Run, runs without progress for SYNC_STALE_AFTER don't count."""
+    return frappe.db.get_value(
+        "Meta Sync Run",
+        {"status": ["in", ["Queued", "Running"]], "modified": [">=", get_stale_cutoff()]}
+    )
+
+
+def ensure_no_active_sync_run():
+    if get_active_sync_run():
+        frappe.throw("A Meta sync is already running, please wait for it to finish.")
+
+
+def add_sync_tasks(run_name, tasks):
+    """Append tasks to the pending list of a run, they're picked up as slots free up."""
+    total = frappe.cache.incrby(sync_key(run_name, "total"), len(tasks))
+    frappe.cache.expire(sync_key(run_name, "total"), SYNC_STATE_TTL)
+    for task in tasks:
+        frappe.cache.rpush(sync_cache_key(run_name, "pending"), json.dumps(task))
+    frappe.db.set_value("Meta Sync Run", run_name, "total_tasks", total, update_modified=False)
+
+
+def fill_sync_slots(run_name):
+    """Queue pending tasks of a run until SYNC_CONCURRENCY sync jobs are running."""
+    running_key = frappe.cache.make_key(SYNC_RUNNING_KEY)
+    while True:
+        # Take a slot first, so concurrent callers can't overshoot the cap
+        if frappe.cache.incr(running_key) > SYNC_CONCURRENCY:
+            frappe.cache.decr(running_key)
+            return
+
+        task = frappe.cache.lpop(sync_cache_key(run_name, "pending"))
+        if not task:
+            frappe.cache.decr(running_key)
+            return
+
+        frappe.cache.expire(running_key, SYNC_STATE_TTL)
+        frappe.enqueue(
+            "onelead.utils.meta.sync.run_sync_task",
+            run_name=run_name,
+            task=json.loads(task),
+            queue=SYNC_QUEUE
+        )
+
+
+def run_sync_task(run_name, task):
+    try:
+        if task["type"] == "account":
+            sync_account_task(run_name, task)
+        else:
+            sync_page_task(run_name, task)
+        frappe.db.commit()
+    except Exception:
+        frappe.db.rollback()
+        frappe.cache.incr(sync_key(run_name, "failed"))
+        frappe.cache.rpush(sync_cache_key(run_name, "errors"), f"{describe_task(task)}: {frappe.get_traceback()}")
+        frappe.log_error(frappe.get_traceback(), "Meta Sync Error")
+    finally:
+        # The slots of a run closed as stale were already reset
+        if frappe.db.get_value("Meta Sync Run", run_name, "status") != "Failed":
+            frappe.cache.decr(frappe.cache.make_key(SYNC_RUNNING_KEY))
+        fill_sync_slots(run_name)
+        record_sync_progress(run_name)
+
+
+def sync_account_task(run_name, task):
+    account = task["account"]
+    page_ids = sync_ad_account(account)
+
+    if not frappe.db.get_single_value("Meta Webhook Config", "page_flow"):
+        return
+
+    # Forms of the account's pages are linked to campaigns through this map
+    campaign_to_form_dict = fetch_campaigns(page_id="", ad_account_id=account["account_id"], page_flow=True)
+    frappe.cache.set_value(
+        sync_cache_key(run_name, f"campaign_forms:{account['account_id']}"),
+        campaign_to_form_dict,
+        expires_in_sec=SYNC_STATE_TTL
+    )
+    add_sync_tasks(run_name, [
+        {"type": "page", "page_id": page_id, "account_id": account["account_id"]}
+        for page_id in page_ids
+    ])
+
+
+def sync_page_task(run_name, task):
+    campaign_to_form_dict = frappe.cache.get_value(sync_cache_key(run_name, f"campaign_forms:{task['account_id']}")) or {}
+    form_ids = fetch_forms_based_on_page(page_id=task["page_id"], campaign_to_form_dict=campaign_to_form_dict)
+    create_meta_ads_page_config_doc(task["page_id"], form_ids)
+
+
+def record_sync_progress(run_name):
+    """Count a finished task, the task finishing the last one closes the run."""
+    finished = frappe.cache.incr(sync_key(run_name, "finished"))
+    frappe.cache.expire(sync_key(run_name, "finished"), SYNC_STATE_TTL)
+    total = int(frappe.cache.get(sync_key(run_name, "total")) or 0)
+
+    if finished == total:
+        finish_sync_run(run_name)
+    else:
+        # Also moves `modified`, which tells a live run from a stale one
+        frappe.db.set_value("Meta Sync Run", run_name, "finished_tasks", finished)
+    frappe.db.commit()
+
+
+def finish_sync_run(run_name):
+    progress = read_sync_progress(run_name)
+    errors = frappe.cache.lrange(sync_cache_key(run_name, "errors"), 0, -1)
+    frappe.db.set_value("Meta Sync Run", run_name, {
+        "status": "Completed with Errors" if progress["failed_tasks"] else "Completed",
+        "finished_at": now_datetime(),
+        "total_tasks": progress["total_tasks"],
+        "finished_tasks": progress["finished_tasks"],
+        "failed_tasks": progress["failed_tasks"],
+        "error_log": "\n\n".join(frappe.safe_decode(error) for error in errors)
+    })
+    clear_sync_state(run_name)
+
+
+def fail_stale_sync_runs():
+    """Hourly. Close runs that made no progress for SYNC_STALE_AFTER, they'd block new syncs otherwise."""
+    for run_name in frappe.get_all(
+        "Meta Sync Run",
+        filters={"status": ["in", ["Queued", "Running"]], "modified": ["<", get_stale_cutoff()]},
+        pluck="name"
+    ):
+        progress = read_sync_progress(run_name)
+        frappe.db.set_value("Meta Sync Run", run_name, {
+            "status": "Failed",
+            "finished_at": now_datetime(),
+            "total_tasks": progress["total_tasks"],
+            "finished_tasks": progress["finished_tasks"],
+            "failed_tasks": progress["failed_tasks"],
+            "error_log": f"No task finished for {SYNC_STALE_AFTER // 3600} hours, the run's jobs were lost."
+        })
+        clear_sync_state(run_name)
+        # Only one run is active at a time, the slots still taken were held by the lost jobs
+        frappe.cache.delete(frappe.cache.make_key(SYNC_RUNNING_KEY))
+        frappe.db.commit()
+
+
+def get_stale_cutoff():
+    return add_to_date(now_datetime(), seconds=-SYNC_STALE_AFTER)
+
+
+def clear_sync_state(run_name):
+    for suffix in ("total", "finished", "failed"):
+        frappe.cache.delete(sync_key(run_name, suffix))
+    frappe.cache.delete_key(sync_cache_key(run_name, "pending"))
+    frappe.cache.delete_key(sync_cache_key(run_name, "errors"))
+
+
+@frappe.whitelist()
+def get_sync_progress(run_name):
+    frappe.has_permission("Meta Sync Run", "read", throw=True)
+    return read_sync_progress(run_name)
+
+
+def read_sync_progress(run_name):
+    """Live progress of a Meta Sync Run, read from the run counters."""
+    if frappe.cache.get(sync_key(run_name, "total")) is None:
+        return frappe.db.get_value("Meta Sync Run", run_name, ["total_tasks", "finished_tasks", "failed_tasks"], as_dict=True)
+
+    return {
+        "total_tasks": int(frappe.cache.get(sync_key(run_name, "total")) or 0),
+        "finished_tasks": int(frappe.cache.get(sync_key(run_name, "finished")) or 0),
+        "failed_tasks": int(frappe.cache.get(sync_key(run_name, "failed")) or 0),
+    }
+
+
+def describe_task(task):
+    if task["type"] == "account":
+        return f"Ad Account {task['account'].get('account_id')}"
+    return f"Page {task['page_id']}"
+
+
+def sync_key(run_name, suffix):
+    # For the plain redis commands (counters), which don't add the site prefix
+    return frappe.cache.make_key(f"onelead:sync:{run_name}:{suffix}")
+
+
+def sync_cache_key(run_name, suffix):
+    # For the frappe.cache helpers (lists, values), which add the site prefix themselves
+    return f"onelead:sync:{run_name}:{suffix}"
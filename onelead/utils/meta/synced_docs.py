@@ -0,0 +1,102 @@
+import hashlib
+import json
+
+import frappe
+
+# Hash of the values last synced from Meta, stored on every synced doc
+SYNC_HASH_FIELD = "sync_hash"
+
+# Objects resolved per query, the page size the sync requests from the Graph API
+SYNC_BATCH_SIZE = 100
+
+
+def get_sync_hash(values):
+    return hashlib.sha1(json.dumps(values, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def get_synced_doc_state(doctype, key_field, key, fields=()):
+    """Return name, sync_hash and `fields` of the doc synced for a Meta object, None if it's not synced yet."""
+    return frappe.db.get_value(doctype, {key_field: key}, ["name", SYNC_HASH_FIELD, *fields], as_dict=True)
+
+
+def get_synced_doc_states(doctype, key_field, keys, fields=()):
+    """
+    Bulk `get_synced_doc_state`, one `IN (...)` query for a batch of Meta objects.
+
+    Returns:
+        dict: {key: state} of the objects already synced.
+    """
+    keys = list({key for key in keys if key})
+    if not keys:
+        return {}
+
+    return {
+        state[key_field]: state
+        for state in frappe.get_all(
+            doctype,
+            filters={key_field: ["in", keys]},
+            fields=["name", SYNC_HASH_FIELD, key_field, *fields]
+        )
+    }
+
+
+def iter_batches(iterable, size=SYNC_BATCH_SIZE):
+    """Yield lists of `size` items, e.g. from an SDK cursor, which loads the next pages as it's iterated."""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def upsert_synced_doc(doctype, values, existing=None, full_save_fields=(), force_save=False):
+    """
+    Create or update the doc of a Meta object, skipping the write when nothing changed.
+
+    Changed docs are updated with a targeted `set_value`, without validation and hooks.
+    A full `save()` is done instead when `force_save` is set, when the doctype has a Password
+    field among `values` (those are stored encrypted) or when one of `full_save_fields` changed,
+    for fields with side effects in the doc's hooks.
+
+    Args:
+        existing: state of the doc from `get_synced_doc_state`, None for a new object.
+
+    Returns:
+        str: name of the doc.
+    """
+    sync_hash = get_sync_hash(values)
+    if existing and existing.get(SYNC_HASH_FIELD) == sync_hash and not force_save:
+        return existing.name
+
+    if not existing:
+        doc = frappe.new_doc(doctype)
+        doc.update(values)
+        doc.set(SYNC_HASH_FIELD, sync_hash)
+        doc.insert(ignore_permissions=True)
+        return doc.name
+
+    if force_save or needs_full_save(doctype, existing.name, values, full_save_fields):
+        doc = frappe.get_doc(doctype, existing.name)
+        doc.update(values)
+        doc.set(SYNC_HASH_FIELD, sync_hash)
+        doc.save(ignore_permissions=True)
+        return doc.name
+
+    frappe.db.set_value(doctype, existing.name, {**values, SYNC_HASH_FIELD: sync_hash})
+    return existing.name
+
+
+def needs_full_save(doctype, name, values, full_save_fields):
+    password_fields = {df.fieldname for df in frappe.get_meta(doctype).get("fields", {"fieldtype": "Password"})}
+    if password_fields.intersection(values):
+        return True
+
+    fields = [field for field in full_save_fields if field in values]
+    if not fields:
+        return False
+
+    current = frappe.db.get_value(doctype, name, fields, as_dict=True)
+    return any(current.get(field) != values[field] for field in fields)
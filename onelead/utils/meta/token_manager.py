@@ -0,0 +1,161 @@
+import time
+from datetime import datetime
+
+import frappe
+from redis.exceptions import LockNotOwnedError
+
+from .credentials import get_meta_credentials
+
+# Result of the last debug_token check of the user token
+TOKEN_STATE_KEY = "onelead:user_token_state"
+
+# Longest a check is trusted, it's also dropped shortly before the token expires
+TOKEN_STATE_TTL = 6 * 60 * 60
+
+# Invalid tokens are checked again sooner, a replaced token or granted permissions show up quickly
+INVALID_TOKEN_STATE_TTL = 60
+TOKEN_EXPIRY_MARGIN = 10 * 60
+
+TOKEN_CHECK_LOCK = "onelead:user_token_check"
+TOKEN_REFRESH_LOCK = "onelead:user_token_refresh"
+
+
+def ensure_token_valid(refresh_now=False):
+    """
+    Throw if the user token is invalid, from the cached token state.
+
+    Only a cold cache costs a debug_token call, made once for all concurrent callers.
+    A token due for exchange is refreshed by a background job, or right away with `refresh_now`.
+    """
+    state = get_token_state() or check_user_token()
+    if not state.is_valid:
+        frappe.throw(state.error or "User access token is invalid.")
+
+    if state.is_short_lived:
+        if refresh_now:
+            state = refresh_user_token() or state
+        else:
+            enqueue_token_refresh()
+    return state
+
+
+def get_token_state():
+    state = frappe.cache.get_value(TOKEN_STATE_KEY)
+    return frappe._dict(state) if state else None
+
+
+def check_user_token():
+    """Run debug_token on the user token and cache the result, single-flight across workers."""
+    lock = frappe.cache.lock(frappe.cache.make_key(TOKEN_CHECK_LOCK), timeout=60, blocking_timeout=30)
+    if not lock.acquire():
+        frappe.throw("Meta user token check is taking too long, please try again.")
+
+    try:
+        # Another caller may have done the check while this one waited on the lock
+        state = get_token_state()
+        if state:
+            return state
+
+        state = debug_user_token()
+        set_token_state(state)
+        return state
+    finally:
+        release_lock(lock)
+
+
+def debug_user_token():
+    from .manage_ads import is_token_short_lived
+
+    meta_config = frappe.get_cached_doc("Meta Webhook Config")
+    credentials = get_meta_credentials()
+    if not credentials.app_id or not credentials.app_secret or not credentials.user_access_token:
+        frappe.throw("App ID, App Secret, and User Token must all be provided in Meta Webhook Config.")
+
+    try:
+        token_data = is_token_short_lived(meta_config, credentials.user_access_token, credentials.app_secret)
+    except frappe.ValidationError as e:
+        # Invalid token or missing permissions, cached briefly so callers don't retry it each time.
+        # Errors of the call itself aren't ValidationErrors, they reach the caller uncached
+        return frappe._dict(is_valid=False, is_short_lived=False, user_id=None, expires_at=None, error=str(e))
+
+    return frappe._dict(error=None, **token_data)
+
+
+def set_token_state(state):
+    """Cache a token state, and store the parts shown on Meta Webhook Config when they changed."""
+    ttl = TOKEN_STATE_TTL if state.is_valid else INVALID_TOKEN_STATE_TTL
+    if state.expires_at:
+        ttl = int(min(ttl, max(60, state.expires_at - time.time() - TOKEN_EXPIRY_MARGIN)))
+    frappe.cache.set_value(TOKEN_STATE_KEY, dict(state), expires_in_sec=ttl)
+
+    values = {"is_token_valid": 1 if state.is_valid else 0}
+    if state.user_id:
+        values["user_id"] = state.user_id
+    if state.expires_at:
+        values["token_expiry"] = datetime.fromtimestamp(state.expires_at).strftime('%Y-%m-%d %H:%M:%S')
+
+    current = frappe.db.get_singles_dict("Meta Webhook Config")
+    for field, value in values.items():
+        if str(current.get(field) or "") != str(value):
+            frappe.db.set_single_value("Meta Webhook Config", field, value)
+
+
+def clear_token_state(doc=None, method=None, *args):
+    """Drop the cached token state, hooked on Meta Webhook Config as the token may have changed."""
+    frappe.cache.delete_value(TOKEN_STATE_KEY)
+
+
+def enqueue_token_refresh():
+    frappe.enqueue(
+        "onelead.utils.meta.token_manager.refresh_user_token",
+        queue="short",
+        job_id="onelead_user_token_refresh",
+        deduplicate=True
+    )
+
+
+def refresh_user_token():
+    """
+    Exchange a short-lived user token for a long-lived one, single-flight across workers.
+    Returns the new token state, None if another worker is already refreshing.
+    """
+    from .manage_ads import get_long_lived_user_token
+
+    lock = frappe.cache.lock(frappe.cache.make_key(TOKEN_REFRESH_LOCK), timeout=120, blocking_timeout=0)
+    if not lock.acquire():
+        return
+
+    try:
+        state = get_token_state() or check_user_token()
+        if not state.is_valid or not state.is_short_lived:
+            return state
+
+        frappe.logger().info('Meta got short lived token, updating...')
+        credentials = get_meta_credentials()
+        get_long_lived_user_token(
+            frappe.get_doc("Meta Webhook Config"), credentials.user_access_token, credentials.app_secret, credentials.app_id
+        )
+        frappe.db.commit()
+
+        # Saving the new token cleared the state, check the new token once
+        return check_user_token()
+    finally:
+        release_lock(lock)
+
+
+def release_lock(lock):
+    # The Graph call may have outlived the lock, which then already expired
+    try:
+        lock.release()
+    except LockNotOwnedError:
+        pass
+
+
+def schedule_token_refresh():
+    """Hourly. Check the user token ahead of the request paths, and refresh it once it's due."""
+    if not frappe.db.get_single_value("Meta Webhook Config", "app_id"):
+        return
+
+    state = get_token_state()
+    if not state or state.is_short_lived:
+        enqueue_token_refresh()
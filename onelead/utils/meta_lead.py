@@ -7,7 +7,10 @@ from werkzeug.wrappers import Response
 import frappe.utils
 import hashlib
 import hmac
-from frappe.utils.password import get_decrypted_password
+from collections import Counter
+from onelead.utils.meta.credentials import get_meta_credentials
+from onelead.utils.meta.lead_stats import add_to_rollups, get_rollup_dimensions, get_rollup_key
+from onelead.utils.payload_codec import encode_payload
 
 @frappe.whitelist(allow_guest=True)
 def webhook():
@@ -30,57 +33,59 @@ def validate():
         return Response(f"Error in webhook validation: {str(e)}", status=500)
 
 
+# Size of the slices the request body is fed to the HMAC in
+SIGNATURE_CHUNK_SIZE = 64 * 1024
+
 def verify_signature(signature, payload, secret):
-    """Verify the payload signature using HMAC SHA256"""
-    if not signature:
+    """
+    Verify the X-Hub-Signature-256 of the payload using HMAC SHA256.
+    `payload` must be the raw request body bytes, exactly as Meta signed them.
+    """
+    if not signature or not secret:
         return False
 
     # Ensure signature starts with "sha256=" as expected
     if not signature.startswith("sha256="):
         return False
 
-    # Compute HMAC SHA256
-    computed_hash = hmac.new(
-        bytes(secret, 'utf-8'),
-        msg=bytes(payload, 'utf-8'),
-        digestmod=hashlib.sha256
-    ).hexdigest()
+    # Compute HMAC SHA256 over the body in chunks, without copying it
+    mac = hmac.new(bytes(secret, 'utf-8'), digestmod=hashlib.sha256)
+    body = memoryview(payload)
+    for offset in range(0, len(body), SIGNATURE_CHUNK_SIZE):
+        mac.update(body[offset:offset + SIGNATURE_CHUNK_SIZE])
 
     # Compare computed signature with the one from headers
-    return hmac.compare_digest(signature.split("=")[1], computed_hash)
+    return hmac.compare_digest(signature.split("=", 1)[1], mac.hexdigest())
 
 def leadgen():
     """ Process lead data from Meta Ads webhook """
     try:
-        data = frappe.request.json
-        frappe.logger().info(f"Received POST request body: {json.dumps(data)}")
+        body = frappe.request.get_data(cache=True)
 
-        # Validate payload with app secret
-        conf = frappe.get_doc("Meta Webhook Config")
-        app_secret = get_decrypted_password("Meta Webhook Config", conf.name, "app_secret")
-        # app_secret = frappe.db.get_single_value("Meta Webhook Config", "app_secret")
+        # Validate payload with app secret, before parsing anything
+        conf = frappe.get_cached_doc("Meta Webhook Config")
+        app_secret = get_meta_credentials().app_secret
         signature = frappe.request.headers.get("X-Hub-Signature-256")
 
         # check if  developemnt mode is enabled then skip signature verification
         if not frappe.conf.developer_mode:
-            if not verify_signature(signature, json.dumps(data), app_secret):
+            if not verify_signature(signature, body, app_secret):
                 frappe.logger().error("Invalid signature. Payload verification failed.")
                 return Response("Invalid signature", status=403)
 
-        # Log incoming payload
-        for entry in data.get("entry", []):
-            for change in entry.get("changes", []):
-                if change.get("field") == "leadgen":
-                    lead_data = change.get("value")
-                    leadgen_id = lead_data.get("leadgen_id")
-
-                    # Check for duplicates
-                    if frappe.db.exists("Meta Webhook Lead Logs", {"leadgen_id": leadgen_id}):
-                        frappe.logger().info(f"Duplicate leadgen_id detected: {leadgen_id}")
-                        continue
-                    
-                    # log entry
-                    create_lead_log(data, lead_data, conf)
+        payload = body.decode("utf-8")
+        frappe.logger().info(f"Received POST request body: {payload}")
+        data = json.loads(payload)
+
+        # Log every leadgen change of the payload in one go, each log only keeps its own change
+        changes = [
+            {"entry_id": entry.get("id"), "time": entry.get("time"), **change}
+            for entry in data.get("entry", [])
+            for change in entry.get("changes", [])
+            if change.get("field") == "leadgen"
+        ]
+        if changes:
+            create_lead_logs_in_bulk(changes, conf, webhook_body=payload)
 
         return Response("Lead Logged", status=200)
     except Exception as e:
@@ -88,36 +93,196 @@ def leadgen():
         return Response(f"Error: {str(e)}", status=500)
 
 
-def create_lead_log(data, lead_data, global_conf):
+# Columns written for every new Meta Webhook Lead Logs row
+LEAD_LOG_FIELDS = (
+    "raw_payload", "received_time", "leadgen_id", "page_id", "source", "ad_id", "form_id",
+    "created_time", "processing_status", "error_message", "config_doctype_name", "config_reference",
+    "config_not_enabled", "campaign", "lead_doctype", "lead_form", "webhook_payload",
+    "lead_payload", "organic", "platform", "rollup_key"
+)
+
+
+def get_webhook_payload_name(payload):
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def store_webhook_payload(payload, change_count, received_time=None):
+    """
+    Store the webhook body once in Meta Webhook Payload, named by its sha256 so a
+    redelivered payload is stored only once. Returns the payload name.
+    """
+    payload_hash = get_webhook_payload_name(payload)
+    timestamp = now()
+    user = frappe.session.user
+    # A concurrent redelivery of the same body may store it first, that copy is kept
+    frappe.db.bulk_insert(
+        "Meta Webhook Payload",
+        ["name", "creation", "modified", "owner", "modified_by", "docstatus", "idx",
+            "payload_hash", "payload", "change_count", "received_time"],
+        [(payload_hash, timestamp, timestamp, user, user, 0, 0,
+            payload_hash, payload, change_count, received_time or timestamp)],
+        ignore_duplicates=True
+    )
+    return payload_hash
+
+
+def create_lead_log(change, global_conf, webhook_payload=None):
     """Create a log entry for the incoming lead"""
+    form_map = get_lead_form_map([change.get("value", {}).get("form_id")])
+    log_values = build_lead_log(change, global_conf, form_map, webhook_payload)
+    if not log_values:
+        return
+
+    lead_log = frappe.new_doc("Meta Webhook Lead Logs")
+    lead_log.update(log_values)
+    lead_log.insert(ignore_permissions=True)
+    return lead_log
+
+
+def create_lead_logs_in_bulk(changes, global_conf, webhook_body=None, source="Webhook", lead_payloads=None, dispatch=True):
+    """
+    Log all leadgen changes of a webhook payload with a single dedup query and a single
+    multi-row insert, then hand the new logs over for processing.
+
+    `webhook_body` is stored in Meta Webhook Payload once a log of it was actually inserted,
+    so redelivered or filtered out bodies leave nothing behind.
+
+    `lead_payloads` ({leadgen_id: lead data}) is stored on the logs when the lead details are
+    already known, e.g. for backfilled leads. Pass `dispatch=False` to process the logs yourself.
+    """
+    leadgen_ids = [change.get("value", {}).get("leadgen_id") for change in changes]
+    existing_ids = set(frappe.get_all(
+        "Meta Webhook Lead Logs",
+        filters={"leadgen_id": ["in", leadgen_ids]},
+        pluck="leadgen_id"
+    ))
+    # Archived leads were logged before too
+    existing_ids.update(frappe.get_all(
+        "Lead Log Archive",
+        filters={"source_doctype": "Meta Webhook Lead Logs", "leadgen_id": ["in", leadgen_ids]},
+        pluck="leadgen_id"
+    ))
+    form_map = get_lead_form_map([change.get("value", {}).get("form_id") for change in changes])
+    webhook_payload = get_webhook_payload_name(webhook_body) if webhook_body else None
+
+    log_rows = []
+    for change in changes:
+        leadgen_id = change.get("value", {}).get("leadgen_id")
+
+        # Check for duplicates, in the database and within the payload itself
+        if leadgen_id in existing_ids:
+            frappe.logger().info(f"Duplicate leadgen_id detected: {leadgen_id}")
+            continue
+        existing_ids.add(leadgen_id)
+
+        log_values = build_lead_log(change, global_conf, form_map, webhook_payload, source)
+        if log_values:
+            if lead_payloads and leadgen_id in lead_payloads:
+                log_values.update(get_lead_payload_values(lead_payloads[leadgen_id]))
+            log_rows.append(log_values)
+
+    if not log_rows:
+        return []
+
+    timestamp = now()
+    user = frappe.session.user
+    fields = ["name", "creation", "modified", "owner", "modified_by", "docstatus", "idx", *LEAD_LOG_FIELDS]
+    values = []
+    for log_values in log_rows:
+        log_values["name"] = frappe.generate_hash(length=10)
+        log_values["rollup_key"] = get_rollup_key(get_rollup_dimensions(log_values))
+        values.append((
+            log_values["name"], timestamp, timestamp, user, user, 0, 0,
+            *(log_values.get(field) for field in LEAD_LOG_FIELDS)
+        ))
+
+    # The webhook, polling and backfill can log the same lead at once, the insert skips leads
+    # logged since the dedup query instead of failing for all of them
+    frappe.db.bulk_insert("Meta Webhook Lead Logs", fields, values, ignore_duplicates=True)
+    inserted = set(frappe.get_all(
+        "Meta Webhook Lead Logs",
+        filters={"name": ["in", [log_values["name"] for log_values in log_rows]]},
+        pluck="name"
+    ))
+    log_rows = [log_values for log_values in log_rows if log_values["name"] in inserted]
+    if not log_rows:
+        return []
+
+    if webhook_body:
+        store_webhook_payload(webhook_body, len(changes))
+
+    # bulk_insert skips the controller, so the logs are counted in the rollup here
+    add_to_rollups(Counter(get_rollup_dimensions(log_values) for log_values in log_rows))
+    frappe.logger().info(f"Logged {len(log_rows)} leads from {source}")
+
+    log_names = [log_values["name"] for log_values in log_rows]
+    if dispatch:
+        # bulk_insert skips the after_insert hook, so dispatch processing explicitly
+        from onelead.utils.meta.manage_leads import dispatch_logged_leads
+        dispatch_logged_leads(log_names)
+    return log_names
+
+
+def get_lead_form_map(form_ids):
+    """Return {form_id: lead_doctype_reference} for the configured Meta Lead Forms among form_ids."""
+    form_ids = list({form_id for form_id in form_ids if form_id})
+    if not form_ids:
+        return {}
+
+    return {
+        form.form_id: form.lead_doctype_reference
+        for form in frappe.get_all(
+            "Meta Lead Form",
+            filters={"form_id": ["in", form_ids]},
+            fields=["form_id", "lead_doctype_reference"]
+        )
+    }
+
+
+def get_lead_payload_values(lead_data):
+    """Return the lead log values holding the lead details fetched from Meta."""
+    return {
+        "lead_payload": encode_payload(lead_data),
+        "organic": 1 if lead_data.get("is_organic") else 0,
+        "platform": 'Instagram' if lead_data.get("platform") == 'ig' else 'Facebook' if lead_data.get("platform") == 'fb' else '',
+    }
+
+
+def build_lead_log(change, global_conf, form_map, webhook_payload=None, source="Webhook"):
+    """
+    Build the field values of a lead log, returns None if the form is not fetched yet.
+    `change` is the leadgen change along with its entry id and time, which is all that
+    goes into raw_payload, the complete body is referenced through `webhook_payload`.
+    """
+    lead_data = change.get("value", {})
     leadgen_id = lead_data.get("leadgen_id")
     page_id = lead_data.get("page_id")
     form_id = lead_data.get("form_id")
     ad_id = lead_data.get("ad_id")
     created_time = lead_data.get("created_time")
 
-    lead_log = frappe.new_doc("Meta Webhook Lead Logs")
-    lead_log.update({
-        "raw_payload": json.dumps(data),
+    lead_log = frappe._dict({
+        "raw_payload": encode_payload(change),
+        "webhook_payload": webhook_payload,
         "received_time": now(),
         "leadgen_id": leadgen_id,
         "page_id": page_id,
-        "source": "Webhook",
+        "source": source,
         "ad_id": ad_id,
         "form_id": form_id,
-        "Source": 'Webhook',
         "created_time": convert_epoch_to_frappe_date(created_time),
-        "processing_status": "Pending"
+        "processing_status": "Pending",
+        "config_not_enabled": 0,
+        "organic": 0
     })
 
-    configured_form = frappe.db.exists("Meta Lead Form", {"form_id": form_id})
+    configured_form = form_id in form_map
     config = get_lead_config(page_id, form_id, global_conf)
     lead_log.config_doctype_name = "Meta Ads Page Config" if global_conf.page_flow else "Meta Ads Webhook Config"
 
 
     if configured_form:
-        form_doc = frappe.get_doc("Meta Lead Form", {"form_id": form_id})
-        lead_log.lead_doctype = form_doc.lead_doctype_reference
+        lead_log.lead_doctype = form_map[form_id]
         lead_log.lead_form = form_id
         # 1a. remove form_doc.campaign for M:M relationship
         # if form_doc.campaign:
@@ -136,35 +301,64 @@ def create_lead_log(data, lead_data, global_conf):
     if config:
         lead_log.config_reference = config.name
         if not config.get('enable'):
-            lead_log.config_not_enabled = True
+            lead_log.config_not_enabled = 1
         if config.get('campaign', None):
             lead_log.campaign = config.campaign
     else:
         lead_log.processing_status = "Unconfigured"
         lead_log.error_message = ("No configuration found for form_id in 'Meta Lead Form'" if not configured_form else "No configuration found for page_id and form_id in 'Meta Ads Webhook Config'")
 
-    lead_log.insert(ignore_permissions=True)
+    return lead_log
 
 
 def get_lead_config(page_id, form_id, global_conf):
     """ Retrieve lead configuration based on page_id (and optionally form_id) in Meta Ads Webhook Config """
-    filters = {"page": page_id}
     doctype_name = "Meta Ads Page Config" if global_conf.page_flow else "Meta Ads Webhook Config"
-    
-    config_list = frappe.get_all(doctype_name, filters=filters)
+    return get_lead_routing_index(doctype_name).get(f"{page_id}|{form_id}")  # None if no configuration found
+
+
+LEAD_ROUTING_CACHE_KEY = "onelead:lead_routing:{}"
+
+def get_lead_routing_index(doctype_name):
+    """
+    Return the cached {"page_id|form_id": config} index of a config doctype, where config holds
+    the `name`, `enable` and `campaign` of the config doc the form is listed in.
+    """
+    return frappe.cache.get_value(
+        LEAD_ROUTING_CACHE_KEY.format(doctype_name),
+        generator=lambda: build_lead_routing_index(doctype_name)
+    )
 
-    if config_list:
-        for config in config_list:
-            config_doc = frappe.get_doc(doctype_name, config.name)
+def build_lead_routing_index(doctype_name):
+    """Build the routing index of a config doctype from its `forms_list` rows in one query."""
+    meta = frappe.get_meta(doctype_name)
+    enable_column = "config.enable" if meta.has_field("enable") else "NULL"
+    campaign_column = "config.campaign" if meta.has_field("campaign") else "NULL"
 
-            # Ensure the form exists in the config's forms list
-            form_exists = any(form.meta_lead_form == form_id for form in config_doc.forms_list)
-            # frappe.logger().info(f"Form Exists in Config {config_doc.name}? {form_exists}")
+    rows = frappe.db.sql(f"""
+        SELECT config.name, config.page, form.meta_lead_form,
+            {enable_column} AS enable, {campaign_column} AS campaign
+        FROM `tab{doctype_name}` config
+        JOIN `tabMeta Campaign Form List` form
+            ON form.parent = config.name AND form.parenttype = %s AND form.parentfield = 'forms_list'
+        ORDER BY config.modified DESC
+    """, (doctype_name,), as_dict=True)
 
-            if form_exists:
-                return config_doc  # Return config if found
+    index = {}
+    for row in rows:
+        # The most recently modified config wins, same as the order frappe.get_all returned
+        index.setdefault(f"{row.page}|{row.meta_lead_form}", frappe._dict({
+            "name": row.name,
+            "enable": row.enable,
+            "campaign": row.campaign
+        }))
+    return index
 
-    return None  # No configuration found for the page_id and form_id
+def clear_lead_routing_index(doc=None, method=None, *args):
+    """Drop the routing index when a config doc or its forms_list changes."""
+    doctype_names = [doc.doctype] if doc else ["Meta Ads Page Config", "Meta Ads Webhook Config"]
+    for doctype_name in doctype_names:
+        frappe.cache.delete_value(LEAD_ROUTING_CACHE_KEY.format(doctype_name))
 
 def convert_epoch_to_frappe_date(epoch_time):
     """Convert epoch time to Frappe's date-time format."""
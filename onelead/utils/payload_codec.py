@@ -0,0 +1,53 @@
+import base64
+import json
+import zlib
+
+# Compressed payloads are stored as a JSON object holding this key, so they still fit JSON columns
+CODEC_KEY = "__codec__"
+CODEC = "zlib"
+
+# Smaller payloads are stored as is, compressing them would hardly save anything
+MIN_COMPRESSED_SIZE = 512
+
+
+def encode_payload(value):
+    """
+    Return the JSON text to store for a payload (JSON text or a JSON-able value),
+    zlib compressed behind a codec marker when that's smaller.
+    """
+    text = value if isinstance(value, str) else json.dumps(value)
+    if len(text) < MIN_COMPRESSED_SIZE:
+        return text
+
+    encoded = json.dumps({CODEC_KEY: CODEC, "data": compress(text)})
+    return encoded if len(encoded) < len(text) else text
+
+
+def decode_payload(value):
+    """Return the stored payload parsed, compressed or not. None for an empty one."""
+    text = decode_payload_text(value)
+    return json.loads(text) if text else None
+
+
+def decode_payload_text(value):
+    """Return the stored payload as plain JSON text, older uncompressed payloads are returned as is."""
+    if not value or not is_encoded(value):
+        return value
+
+    data = json.loads(value)
+    if data.get(CODEC_KEY) != CODEC:
+        raise ValueError(f"Unknown payload codec: {data.get(CODEC_KEY)}")
+    return decompress(data["data"])
+
+
+def is_encoded(value):
+    # Cheap check on the head, so plain payloads aren't parsed for it
+    return isinstance(value, str) and CODEC_KEY in value[:32]
+
+
+def compress(text):
+    return base64.b64encode(zlib.compress(text.encode("utf-8"))).decode("ascii")
+
+
+def decompress(data):
+    return zlib.decompress(base64.b64decode(data)).decode("utf-8")
@@ -1,33 +1,22 @@
 import frappe
-from frappe.utils.background_jobs import get_jobs
+
+from onelead.utils.meta.lead_stats import STATUS_NOT_SET, get_status_count
+from onelead.utils.meta.sync import get_active_sync_run
 
 @frappe.whitelist()
 def check_jobs_running():
-    """
-    Checks if any jobs with IDs starting with 'fetch_forms_' or 'fetch_campaigns_' are in 'queued' or 'started' status.
-    Returns True if any such job is found; otherwise, returns False.
-    """
-    job_found = False
-    queued_jobs = get_jobs(site=frappe.local.site, queue="long")
-
-    print(queued_jobs.items())
-
-    # Iterate through queued jobs in the "default" queue
-    for job in queued_jobs.get(frappe.local.site, []):
-        if "page_flow_fetch_page_and_campaign" in job:
-            # if job_info.get("status") in ["queued", "started"]:
-            job_found = True
-            break  # Exit loop as soon as we find a matching job
-
-    return job_found
+    """Returns True while a Meta Sync Run is in progress, runs stale for SYNC_STALE_AFTER aside."""
+    return bool(get_active_sync_run())
 
 @frappe.whitelist()
 def get_lead_conversion_rate():
+    # The counters skip permissions, the cards they back read lead logs
+    frappe.has_permission("Meta Webhook Lead Logs", "read", throw=True)
+
     # Define the statuses to include in total count
     relevant_statuses = ["Processed", "Error", "Loss"]
-    # Total records matching filters
-    total = frappe.db.count("Meta Webhook Lead Logs", 
-                            filters={"processing_status": ["in", relevant_statuses]})
+    # Total records matching filters, read from the status counters
+    total = get_status_count(*relevant_statuses)
 
     if total == 0:
         return {
@@ -35,12 +24,32 @@ def get_lead_conversion_rate():
             "fieldtype": "Percent"
         }
 
-    converted = frappe.db.count("Meta Webhook Lead Logs", filters={"processing_status": "Processed"})
+    converted = get_status_count("Processed")
 
     rate = (converted / total) * 100
-    print(rate)
 
     return {
         "value": round(rate, 2),
         "fieldtype": "Percent"
     }
+
+# Number card methods, counted from the lead status counters, for users who can read lead logs
+@frappe.whitelist()
+def get_processed_leads_count(filters=None):
+    frappe.has_permission("Meta Webhook Lead Logs", "read", throw=True)
+    return get_status_count("Processed")
+
+@frappe.whitelist()
+def get_error_leads_count(filters=None):
+    frappe.has_permission("Meta Webhook Lead Logs", "read", throw=True)
+    return get_status_count("Error")
+
+@frappe.whitelist()
+def get_loss_leads_count(filters=None):
+    frappe.has_permission("Meta Webhook Lead Logs", "read", throw=True)
+    return get_status_count("Loss")
+
+@frappe.whitelist()
+def get_unconfigured_leads_count(filters=None):
+    frappe.has_permission("Meta Webhook Lead Logs", "read", throw=True)
+    return get_status_count("Unconfigured", "Disabled", STATUS_NOT_SET)